@@ -0,0 +1,70 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Per-request overhead of building the Radicale application.
+
+Compares building ``Application`` for every request (the old behaviour of
+``DjRadicaleView``) with the process-wide application for trivial OPTIONS
+and PROPFIND requests.
+"""
+
+import common
+
+from django.contrib.auth.models import User
+
+from radicale import Application, config
+
+from djradicale.models import DBCollection, DBProperties
+from djradicale.tests import DAVClient
+from djradicale.views import get_application
+
+NUMBER = 200
+
+PROPFIND = '''<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:">
+    <D:prop>
+        <D:getetag/>
+    </D:prop>
+</D:propfind>
+'''
+
+
+def main():
+    common.setup_database()
+    try:
+        User.objects.create_user(username='user', password='password')
+        DBCollection.objects.create(path='user/calendar.ics', parent_path='user')
+        DBProperties.objects.create(path='user/calendar.ics', text='{"tag": "VCALENDAR"}')
+
+        common.report('Application() per request',
+                      common.timeit(lambda: Application(config.load()), NUMBER))
+        common.report('get_application() per request',
+                      common.timeit(get_application, NUMBER))
+
+        client = DAVClient()
+        client.http_auth('user', 'password')
+        common.report('OPTIONS /radicale/',
+                      common.timeit(lambda: client.options('/radicale/'), NUMBER))
+        common.report('PROPFIND /radicale/user/calendar.ics/', common.timeit(
+            lambda: client.propfind('/radicale/user/calendar.ics/', data=PROPFIND),
+            NUMBER))
+    finally:
+        common.teardown_database()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Size and read throughput of compressed item texts.
+
+Stores 5k events with an embedded VTIMEZONE as plain text, compressed
+and/or with the VTIMEZONEs deduplicated, then reads them back through
+``Collection.get_all``.
+"""
+
+import sys
+import time
+
+import common
+
+from radicale import config
+from radicale.item import Item
+
+from djradicale.models import DBItem, DBTimezone
+from djradicale.storage import Storage
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+VEVENT = '''BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//djradicale//benchmarks//EN
+BEGIN:VTIMEZONE
+TZID:Europe/Berlin
+BEGIN:DAYLIGHT
+TZOFFSETFROM:+0100
+TZOFFSETTO:+0200
+TZNAME:CEST
+DTSTART:19700329T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU
+END:DAYLIGHT
+BEGIN:STANDARD
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+TZNAME:CET
+DTSTART:19701025T030000
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU
+END:STANDARD
+END:VTIMEZONE
+BEGIN:VEVENT
+UID:event-{i}
+DTSTAMP:20200101T000000Z
+DTSTART;TZID=Europe/Berlin:20200101T100000
+DTEND;TZID=Europe/Berlin:20200101T110000
+SUMMARY:Event {i}
+DESCRIPTION:Weekly meeting of the team, agenda in the shared folder
+END:VEVENT
+END:VCALENDAR
+'''
+
+
+def stored_size(path):
+    size = 0
+    for text, data in DBItem.objects.filter(
+            collection__path=path).values_list('text', 'data'):
+        size += len(text.encode()) + (len(data) if data is not None else 0)
+    for text in DBTimezone.objects.values_list('text', flat=True):
+        size += len(text.encode())
+    return size
+
+
+def main():
+    common.setup_database()
+    try:
+        for compress, deduplicate in ((False, False), (True, False),
+                                      (False, True), (True, True)):
+            DBTimezone.objects.all().delete()
+            configuration = config.load()
+            configuration.update({'storage': {
+                'compress': str(compress),
+                'deduplicate_timezones': str(deduplicate),
+            }}, 'benchmark')
+            storage = Storage(configuration)
+            name = 'compress=%s deduplicate=%s' % (compress, deduplicate)
+            path = 'user/%s-%s.ics' % (compress, deduplicate)
+            items = []
+            for i in range(EVENTS):
+                item = Item(collection_path=path, text=VEVENT.format(i=i))
+                item.prepare()
+                items.append(item)
+            collection = storage.create_collection(
+                '/%s/' % path, iter(items), {'tag': 'VCALENDAR'})
+
+            common.report('%s (stored size)' % name,
+                          stored_size(path) / 1024, 'KiB')
+            start = time.perf_counter()
+            for item in collection.get_all():
+                item.serialize()
+            elapsed = time.perf_counter() - start
+            common.report('%s (read throughput)' % name,
+                          EVENTS / elapsed, 'items/s')
+    finally:
+        common.teardown_database()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Parallel writers to the calendars of different users, next to readers.
+
+Compares the mode-aware ``Storage.acquire_lock`` with wrapping every
+request in one transaction. SQLite allows one writer at a time whatever
+the locking, run against PostgreSQL for meaningful writer numbers.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import common
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from radicale import types
+
+from djradicale.models import DBCollection, DBProperties
+from djradicale.storage import Storage
+from djradicale.tests import DAVClient
+
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+REQUESTS = 50
+
+VEVENT = '''BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//djradicale//benchmarks//EN
+BEGIN:VEVENT
+UID:{uid}
+DTSTAMP:20200101T000000Z
+DTSTART:20200101T100000Z
+DTEND:20200101T110000Z
+SUMMARY:Event {uid}
+END:VEVENT
+END:VCALENDAR
+'''
+
+PROPFIND = '''<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:">
+    <D:prop>
+        <D:getetag/>
+    </D:prop>
+</D:propfind>
+'''
+
+
+@types.contextmanager
+def global_lock(self, mode, user):
+    with transaction.atomic():
+        yield
+
+
+def writer(username, run, errors):
+    client = DAVClient()
+    client.http_auth(username, 'password')
+    try:
+        for i in range(REQUESTS):
+            uid = '%s-%d' % (run, i)
+            response = client.put(
+                '/radicale/%s/calendar.ics/%s.ics' % (username, uid),
+                data=VEVENT.format(uid=uid), content_type='text/calendar')
+            if response.status_code != 201:
+                errors.append(response.status_code)
+    finally:
+        connection.close()
+
+
+def reader(username, run, errors):
+    client = DAVClient()
+    client.http_auth(username, 'password')
+    try:
+        for i in range(REQUESTS):
+            response = client.propfind(
+                '/radicale/%s/calendar.ics/' % username, data=PROPFIND,
+                HTTP_DEPTH='1')
+            if response.status_code != 207:
+                errors.append(response.status_code)
+    finally:
+        connection.close()
+
+
+def measure(name, run):
+    errors = []
+    threads = []
+    for i in range(THREADS):
+        threads.append(threading.Thread(
+            target=writer, args=('writer-%d' % i, run, errors)))
+        threads.append(threading.Thread(
+            target=reader, args=('reader-%d' % i, run, errors)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    name = '%s (%d writers, %d readers)' % (name, THREADS, THREADS)
+    common.report(name, len(threads) * REQUESTS / elapsed, 'requests/s')
+    common.report(name, len(errors), 'failed requests')
+
+
+def main():
+    if connection.vendor == 'sqlite':
+        # threads can't share an in-memory database without table locks
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            tempfile.mkdtemp(), 'bench_concurrency.sqlite3')
+    common.setup_database()
+    try:
+        for kind in ('writer', 'reader'):
+            for i in range(THREADS):
+                username = '%s-%d' % (kind, i)
+                User.objects.create_user(username=username, password='password')
+                for path in (username, '%s/calendar.ics' % username):
+                    DBCollection.objects.create(
+                        path=path, parent_path=path.rpartition('/')[0])
+                DBProperties.objects.create(
+                    path='%s/calendar.ics' % username, text='{"tag": "VCALENDAR"}')
+
+        acquire_lock = Storage.acquire_lock
+        Storage.acquire_lock = global_lock
+        try:
+            measure('one transaction per request', 'global')
+        finally:
+            Storage.acquire_lock = acquire_lock
+        measure('mode-aware acquire_lock()', 'mode-aware')
+    finally:
+        common.teardown_database()
+
+
+if __name__ == '__main__':
+    main()
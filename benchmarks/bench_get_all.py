@@ -0,0 +1,84 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Memory used by iterating a collection with 20k items.
+
+Compares the chunked iteration of ``Collection.get_all`` with iterating
+a plain queryset, which caches every row before yielding the first one.
+"""
+
+import sys
+import time
+import tracemalloc
+
+import common
+
+from radicale import config
+
+from djradicale.models import DBCollection, DBItem
+from djradicale.storage import BULK_SIZE, Storage
+
+ITEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+VCARD = '''BEGIN:VCARD
+VERSION:3.0
+UID:contact-{i}
+FN:Contact {i}
+N:Contact {i};;;;
+NOTE:{note}
+END:VCARD
+'''
+
+
+def measure(name, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for _ in fn():
+        count += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert count == ITEMS
+    common.report('%s (peak memory)' % name, peak / 1024 / 1024, 'MiB')
+    common.report('%s (time)' % name, elapsed * 1000)
+
+
+def main():
+    common.setup_database()
+    try:
+        dbcollection = DBCollection.objects.create(
+            path='user/contacts.vcf', parent_path='user')
+        note = 'x' * 2000
+        DBItem.objects.bulk_create((
+            DBItem(collection=dbcollection, name='contact-%d.vcf' % i,
+                   text=VCARD.format(i=i, note=note), etag='"%d"' % i)
+            for i in range(ITEMS)), batch_size=BULK_SIZE)
+
+        collection = dbcollection.as_collection(Storage(config.load()))
+        def iterate_queryset():
+            for i in DBItem.objects.filter(collection=dbcollection):
+                yield i.as_item(collection)
+
+        measure('queryset x %d' % ITEMS, iterate_queryset)
+        measure('get_all() x %d' % ITEMS, collection.get_all)
+    finally:
+        common.teardown_database()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Importing a calendar with 10k events.
+
+Compares uploading the (already parsed) items one by one with the bulk
+path used by ``Storage.create_collection`` for whole-collection PUTs.
+"""
+
+import sys
+import time
+
+import common
+
+from django.db import transaction
+
+from radicale import config
+from radicale.item import Item
+
+from djradicale.models import DBCollection, DBItem
+from djradicale.storage import Storage
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+VEVENT = '''BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//djradicale//benchmarks//EN
+BEGIN:VEVENT
+UID:event-{i}
+DTSTAMP:20200101T000000Z
+DTSTART:20200101T100000Z
+DTEND:20200101T110000Z
+SUMMARY:Event {i}
+END:VEVENT
+END:VCALENDAR
+'''
+
+
+def make_items(path):
+    items = []
+    for i in range(EVENTS):
+        item = Item(collection_path=path, text=VEVENT.format(i=i))
+        item.prepare()
+        items.append(item)
+    return items
+
+
+def measure(name, fn):
+    with common.QueryCounter() as queries:
+        start = time.perf_counter()
+        with transaction.atomic():
+            fn()
+        elapsed = time.perf_counter() - start
+    common.report('%s (%d queries)' % (name, queries.count), elapsed * 1000)
+
+
+def main():
+    common.setup_database()
+    try:
+        storage = Storage(config.load())
+        props = {'tag': 'VCALENDAR'}
+
+        items = make_items('user/one-by-one.ics')
+        collection = storage.create_collection('/user/one-by-one.ics/', props=props)
+
+        def upload():
+            for item in items:
+                collection.upload(item.uid + '.ics', item)
+
+        measure('upload() x %d' % EVENTS, upload)
+
+        items = make_items('user/bulk.ics')
+        measure('create_collection() with %d items' % EVENTS, lambda: (
+            storage.create_collection('/user/bulk.ics/', iter(items), props)))
+
+        for path in ('user/one-by-one.ics', 'user/bulk.ics'):
+            assert DBItem.objects.filter(collection__path=path).count() == EVENTS
+        DBCollection.objects.all().delete()
+    finally:
+        common.teardown_database()
+
+
+if __name__ == '__main__':
+    main()
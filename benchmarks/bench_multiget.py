@@ -0,0 +1,93 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+calendar-multiget REPORT of 5k hrefs.
+
+Half of the requested hrefs exist, the others are answered with 404.
+"""
+
+import sys
+import time
+
+import common
+
+from django.contrib.auth.models import User
+
+from radicale import config
+from radicale.item import Item
+
+from djradicale.storage import Storage
+from djradicale.tests import DAVClient
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+VEVENT = '''BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//djradicale//benchmarks//EN
+BEGIN:VEVENT
+UID:event-{i}
+DTSTAMP:20200101T000000Z
+DTSTART:20200101T100000Z
+DTEND:20200101T110000Z
+SUMMARY:Event {i}
+END:VEVENT
+END:VCALENDAR
+'''
+
+MULTIGET = '''<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+    <D:prop>
+        <D:getetag/>
+        <C:calendar-data/>
+    </D:prop>
+{hrefs}
+</C:calendar-multiget>
+'''
+
+
+def main():
+    common.setup_database()
+    try:
+        User.objects.create_user(username='user', password='password')
+        items = []
+        for i in range(EVENTS // 2):
+            item = Item(collection_path='user/calendar.ics', text=VEVENT.format(i=i))
+            item.prepare()
+            items.append(item)
+        Storage(config.load()).create_collection(
+            '/user/calendar.ics/', iter(items), {'tag': 'VCALENDAR'})
+
+        hrefs = '\n'.join(
+            '    <D:href>/radicale/user/calendar.ics/event-%d.ics</D:href>' % i
+            for i in range(EVENTS))
+        client = DAVClient()
+        client.http_auth('user', 'password')
+        with common.QueryCounter() as queries:
+            start = time.perf_counter()
+            response = client.report(
+                '/radicale/user/calendar.ics/', data=MULTIGET.format(hrefs=hrefs))
+            elapsed = time.perf_counter() - start
+        assert response.status_code == 207
+        assert response.content.count(b'HTTP/1.1 404') == EVENTS - EVENTS // 2
+        common.report('calendar-multiget of %d hrefs (%d queries)' % (
+            EVENTS, queries.count), elapsed * 1000)
+    finally:
+        common.teardown_database()
+
+
+if __name__ == '__main__':
+    main()
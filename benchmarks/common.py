@@ -0,0 +1,91 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Shared setup for the benchmark scripts.
+
+Benchmarks run against the test project settings with a throwaway test
+database, e.g.::
+
+    $ python benchmarks/bench_application.py
+"""
+
+import logging
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'test_project'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+# keep benchmark output readable
+logging.getLogger('djradicale').setLevel(logging.ERROR)
+logging.getLogger('radicale').setLevel(logging.ERROR)
+
+_old_database_name = None
+
+
+def setup_database():
+    global _old_database_name
+    _old_database_name = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def teardown_database():
+    connection.creation.destroy_test_db(_old_database_name, verbosity=0)
+
+
+def timeit(fn, number):
+    """
+    Return the mean time of ``number`` calls of ``fn`` in milliseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) * 1000 / number
+
+
+class QueryCounter(object):
+    """
+    Count the queries executed inside the ``with`` block.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+def report(name, value, unit='ms'):
+    print('%-50s %10.3f %s' % (name, value, unit))
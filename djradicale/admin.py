@@ -17,7 +17,32 @@
 from django import forms
 from django.contrib import admin
 
+from radicale import config
+from radicale.item import Item, get_etag
+
 from .models import DBCollection, DBItem, DBProperties
+from .storage import Collection, Storage
+
+
+def get_storage():
+    # configured like radicale's, for the options and caches it uses
+    return Storage(config.load())
+
+
+def item_changed(dbcollection, name, etag=None):
+    """
+    Update the ETag and sync log of ``dbcollection`` like the storage does
+    after the item ``name`` was saved (``etag`` is set) or deleted.
+    """
+    collection = dbcollection.as_collection(get_storage())
+    collection._item_changed(dbcollection.pk, name, etag)
+
+
+def collection_changed(path):
+    """
+    Drop the cached metadata of the collection at ``path``.
+    """
+    Collection(path, storage=get_storage())._forget_cached()
 
 
 class DBCollectionForm(forms.ModelForm):
@@ -31,6 +56,12 @@ class DBCollectionForm(forms.ModelForm):
 
 
 class DBItemForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            # compressed items are edited as text and saved uncompressed
+            self.initial['text'] = self.instance.get_text()
+
     class Meta(object):
         fields = 'collection', 'name', 'text'
         model = DBItem
@@ -53,13 +84,64 @@ class DBCollectionAdmin(admin.ModelAdmin):
     fields = 'path', 'parent_path'
     list_display = 'path', 'tag', 'last_modified'
 
+    def save_model(self, request, obj, form, change):
+        old_path = None
+        if change:
+            old_path = DBCollection.objects.filter(
+                pk=obj.pk).values_list('path', flat=True).first()
+        super().save_model(request, obj, form, change)
+        if old_path is not None and old_path != obj.path:
+            collection_changed(old_path)
+        collection_changed(obj.path)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        collection_changed(obj.path)
+
+    def delete_queryset(self, request, queryset):
+        paths = list(queryset.values_list('path', flat=True))
+        super().delete_queryset(request, queryset)
+        for path in paths:
+            collection_changed(path)
+
 
 class DBItemAdmin(admin.ModelAdmin):
     form = DBItemForm
-    fields = 'collection', 'name', 'text', 'timestamp'
+    fields = 'collection', 'name', 'text', 'etag', 'timestamp'
     list_display = 'name', 'fn', 'collection', 'timestamp'
     list_filter = 'collection',
-    readonly_fields = 'timestamp',
+    readonly_fields = 'etag', 'timestamp'
+
+    def save_model(self, request, obj, form, change):
+        try:
+            obj.set_item(Item(collection_path=obj.collection.path, text=obj.text))
+        except Exception:
+            # keep invalid texts editable, derived values are unknown
+            obj.set_text(obj.text)
+            obj.etag = get_etag(obj.text)
+            obj.uid = obj.vobject_name = obj.component_name = None
+            obj.start = obj.end = None
+        old = None
+        if change:
+            old = DBItem.objects.select_related('collection').filter(
+                pk=obj.pk).first()
+        super().save_model(request, obj, form, change)
+        if old is not None and (old.collection_id, old.name) != (
+                obj.collection_id, obj.name):
+            # moved or renamed
+            item_changed(old.collection, old.name)
+        item_changed(obj.collection, obj.name, obj.etag)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        item_changed(obj.collection, obj.name)
+
+    def delete_queryset(self, request, queryset):
+        deleted = [(i.collection, i.name)
+                   for i in queryset.select_related('collection')]
+        super().delete_queryset(request, queryset)
+        for dbcollection, name in deleted:
+            item_changed(dbcollection, name)
 
 
 class DBPropertiesAdmin(admin.ModelAdmin):
@@ -67,6 +149,32 @@ class DBPropertiesAdmin(admin.ModelAdmin):
     fields = 'path', 'text'
     list_display = 'path', 'tag'
 
+    @staticmethod
+    def properties_changed(path, text):
+        DBCollection.objects.filter(path=path).touch(text)
+        collection_changed(path)
+
+    def save_model(self, request, obj, form, change):
+        old_path = None
+        if change:
+            old_path = DBProperties.objects.filter(
+                pk=obj.pk).values_list('path', flat=True).first()
+        super().save_model(request, obj, form, change)
+        if old_path is not None and old_path != obj.path:
+            # the collection at the old path has no properties anymore
+            self.properties_changed(old_path, '{}')
+        self.properties_changed(obj.path, obj.text)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.properties_changed(obj.path, '{}')
+
+    def delete_queryset(self, request, queryset):
+        paths = list(queryset.values_list('path', flat=True))
+        super().delete_queryset(request, queryset)
+        for path in paths:
+            self.properties_changed(path, '{}')
+
 
 admin.site.register(DBCollection, DBCollectionAdmin)
 admin.site.register(DBItem, DBItemAdmin)
@@ -14,13 +14,113 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
-from django.contrib.auth import authenticate
+import hashlib
+import hmac
+import logging
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ObjectDoesNotExist
 
 from radicale.auth import BaseAuth
+from radicale.config import positive_int
+
+logger = logging.getLogger('djradicale')
+
+PLUGIN_CONFIG_SCHEMA = {
+    'auth': {
+        'cache_ttl': {
+            'value': '0',
+            'help': 'seconds to remember successful logins (0 to disable)',
+            'type': positive_int,
+        },
+        'cache_alias': {
+            'value': 'default',
+            'help': 'django cache for remembered logins',
+            'type': str,
+        },
+    },
+}
+
+
+def _credentials_key(login, password):
+    digest = hmac.new(
+        settings.SECRET_KEY.encode(),
+        ('%s:%s' % (login, password)).encode(),
+        hashlib.sha256).hexdigest()
+    return 'djradicale:auth:credentials:%s' % digest
+
+
+def _user_key(pk):
+    return 'djradicale:auth:user:%s' % pk
+
+
+def invalidate_login_cache(user):
+    """
+    Forget remembered logins of ``user`` in every configured cache.
+    """
+    for alias in settings.CACHES:
+        caches[alias].delete(_user_key(user.pk))
 
 
 class Auth(BaseAuth):
+    """
+    Django authentication.
+
+    Successful logins are remembered in the django cache for ``cache_ttl``
+    seconds, so DAV clients sending Basic auth on every request don't run
+    the password hasher each time. A remembered login is only valid while
+    the user's version stamp in the cache, dropped whenever the user is
+    saved or deleted, is unchanged.
+
+    The cache must be shared between processes, otherwise the other
+    processes never see the stamps dropped; local caches are refused.
+    """
+    def __init__(self, configuration):
+        super().__init__(configuration.copy(PLUGIN_CONFIG_SCHEMA))
+        self._cache_ttl = self.configuration.get('auth', 'cache_ttl')
+        self._cache_alias = self.configuration.get('auth', 'cache_alias')
+        if self._cache_ttl and isinstance(
+                caches[self._cache_alias], (DummyCache, LocMemCache)):
+            logger.warning(
+                'Not remembering logins, the %r cache is local to the process',
+                self._cache_alias)
+            self._cache_ttl = 0
+
     def login(self, login, password):
+        if not self._cache_ttl:
+            return self._authenticate(login, password)
+
+        cache = caches[self._cache_alias]
+        key = _credentials_key(login, password)
+        cached = cache.get(key)
+        if cached is not None:
+            pk, username, version = cached
+            if cache.get(_user_key(pk)) == version:
+                return username
+
+        try:
+            pk = get_user_model()._default_manager.get_by_natural_key(login).pk
+        except ObjectDoesNotExist:
+            return self._authenticate(login, password)
+
+        # take the version before checking the password, so a concurrent
+        # password change invalidates what is stored below
+        cache.add(_user_key(pk), uuid.uuid4().hex, None)
+        version = cache.get(_user_key(pk))
+        user = authenticate(username=login, password=password)
+        if user is not None and user.is_active:
+            if user.pk == pk and version is not None:
+                cache.set(key, (pk, user.username, version), self._cache_ttl)
+            return user.username
+
+        return None
+
+    def _authenticate(self, login, password):
         user = authenticate(username=login, password=password)
         if user is not None and user.is_active:
             return user.username
@@ -0,0 +1,137 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+import hashlib
+import logging
+import pickle
+import threading
+
+from collections import OrderedDict
+
+import vobject
+
+from django.core.cache import caches
+
+from radicale import item as radicale_item
+
+logger = logging.getLogger('djradicale')
+
+
+class ParseCache(object):
+    """
+    LRU of parsed vobject items.
+
+    Entries are keyed by ``(collection path, href, etag)``, so they never
+    need to be invalidated. The size of the cache is bounded by the total
+    size of the parsed texts in bytes, UTF-8 encoded. Optionally the parsed items are
+    shared between processes in a django cache in their pickled form.
+    """
+    def __init__(self, max_size, cache_alias=''):
+        self.max_size = max_size
+        self.cache_alias = cache_alias
+        self._size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, key):
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return 'djradicale:parsed:%s' % digest
+
+    def get(self, key, text):
+        """
+        Return the parsed ``text`` of the item identified by ``key``.
+
+        ``text`` can be a callable returning the text, it is only called
+        when the item has to be parsed. The returned object is shared and
+        must not be modified.
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key][0]
+
+        entry = None
+        if self.cache_alias:
+            pickled = caches[self.cache_alias].get(self._cache_key(key))
+            if pickled is not None:
+                entry = pickle.loads(pickled)
+        if entry is None:
+            if callable(text):
+                text = text()
+            entry = vobject.readOne(text), len(text.encode())
+            if self.cache_alias:
+                try:
+                    pickled = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+                except Exception as e:
+                    # e.g. timezones holding locks
+                    logger.debug('Failed to pickle item %r: %s', key, e)
+                else:
+                    caches[self.cache_alias].set(self._cache_key(key), pickled)
+
+        vobject_item, size = entry
+        if size <= self.max_size:
+            with self._lock:
+                if key not in self._items:
+                    self._items[key] = entry
+                    self._size += size
+                while self._size > self.max_size:
+                    _, (_, evicted) = self._items.popitem(last=False)
+                    self._size -= evicted
+        return vobject_item
+
+
+class Item(radicale_item.Item):
+    """
+    Item parsing its text through the ``ParseCache`` of the storage.
+
+    The text can be loaded lazily by passing a ``text_loader`` callable
+    instead of ``text``.
+    """
+    def __init__(self, *args, parse_cache=None, text_loader=None, **kwargs):
+        lazy = text_loader is not None and kwargs.get('text') is None
+        if lazy:
+            # satisfies radicale's check, replaced by the loaded text
+            kwargs['text'] = ''
+        super().__init__(*args, **kwargs)
+        if lazy:
+            self._loaded_text = None
+        self._text_loader = text_loader
+        self._parse_cache = parse_cache
+
+    @property
+    def _text(self):
+        if self._loaded_text is None and self._text_loader is not None:
+            self._loaded_text = self._text_loader()
+            self._text_loader = None
+        return self._loaded_text
+
+    @_text.setter
+    def _text(self, value):
+        self._loaded_text = value
+
+    @property
+    def vobject_item(self):
+        if (self._vobject_item is None and self._parse_cache is not None and
+                self._etag is not None):
+            try:
+                # a deferred text is only loaded when it has to be parsed
+                self._vobject_item = self._parse_cache.get(
+                    (self._collection_path, self.href, self._etag),
+                    lambda: self._text)
+            except Exception as e:
+                raise RuntimeError('Failed to parse item %r from %r: %s' % (
+                    self.href, self._collection_path, e)) from e
+        return super().vobject_item
@@ -0,0 +1,52 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from djradicale.models import DBItem
+from djradicale.storage import BULK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Compress the texts of the stored items, or decompress them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--decompress', action='store_true',
+            help='store the texts uncompressed again')
+
+    def handle(self, *args, **options):
+        compress = not options['decompress']
+        items = DBItem.objects.filter(data__isnull=compress).only(
+            'pk', 'text', 'data', 'vtimezones').order_by('pk')
+        converted = last_pk = 0
+        # paginated by primary key, rows stop matching once converted
+        while True:
+            # rows are locked until written back, so concurrent uploads
+            # aren't overwritten with the texts read here
+            with transaction.atomic():
+                chunk = list(items.select_for_update().filter(
+                    pk__gt=last_pk)[:BULK_SIZE])
+                if not chunk:
+                    break
+                for dbitem in chunk:
+                    dbitem.set_text(dbitem.get_text(), compress, dbitem.vtimezones)
+                DBItem.objects.bulk_update(chunk, ['text', 'data', 'vtimezones'])
+            converted += len(chunk)
+            last_pk = chunk[-1].pk
+        self.stdout.write('%s %d items' % (
+            'Compressed' if compress else 'Decompressed', converted))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:15
+
+from django.db import migrations, models
+
+from radicale.item import get_etag
+
+
+def fill_etag(apps, schema_editor):
+    DBItem = apps.get_model('djradicale', 'DBItem')
+    for dbitem in DBItem.objects.only('text').iterator():
+        DBItem.objects.filter(pk=dbitem.pk).update(etag=get_etag(dbitem.text))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbitem',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ETag'),
+        ),
+        migrations.RunPython(fill_etag, migrations.RunPython.noop),
+    ]
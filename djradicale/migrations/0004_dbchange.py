@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0003_dbcollection_etag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbcollection',
+            name='min_sync_token',
+            field=models.BigIntegerField(default=0, verbose_name='Minimal Sync Token'),
+        ),
+        migrations.CreateModel(
+            name='DBChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Deleted')),
+                ('timestamp', models.DateTimeField(auto_now=True, verbose_name='Timestamp')),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='djradicale.dbcollection', verbose_name='Collection')),
+            ],
+            options={
+                'verbose_name': 'Change',
+                'verbose_name_plural': 'Changes',
+                'db_table': 'djradicale_change',
+                'indexes': [models.Index(fields=['collection', 'id'], name='djradicale_change_token')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+def fill_last_modified(apps, schema_editor):
+    DBCollection = apps.get_model('djradicale', 'DBCollection')
+    DBItem = apps.get_model('djradicale', 'DBItem')
+    latest = DBItem.objects.values('collection').annotate(
+        last_modified=models.Max('timestamp'))
+    for row in latest:
+        DBCollection.objects.filter(pk=row['collection']).update(
+            last_modified=row['last_modified'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0004_dbchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbcollection',
+            name='last_modified',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last Modified'),
+        ),
+        migrations.RunPython(fill_last_modified, migrations.RunPython.noop),
+    ]
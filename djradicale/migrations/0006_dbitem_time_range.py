@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:19
+
+import logging
+
+from django.db import migrations, models
+
+from radicale.item import Item
+
+logger = logging.getLogger('djradicale')
+
+
+def fill_time_range(apps, schema_editor):
+    DBItem = apps.get_model('djradicale', 'DBItem')
+    for dbitem in DBItem.objects.select_related('collection').iterator():
+        item = Item(collection_path=dbitem.collection.path, text=dbitem.text)
+        try:
+            start, end = item.time_range
+            component_name = item.component_name
+        except Exception as e:
+            logger.warning('Failed to compute the time range of %r: %s',
+                           dbitem.name, e)
+            continue
+        DBItem.objects.filter(pk=dbitem.pk).update(
+            component_name=component_name, start=start, end=end)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0005_dbcollection_last_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbitem',
+            name='component_name',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='Component Name'),
+        ),
+        migrations.AddField(
+            model_name='dbitem',
+            name='end',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='End'),
+        ),
+        migrations.AddField(
+            model_name='dbitem',
+            name='start',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Start'),
+        ),
+        migrations.AddIndex(
+            model_name='dbitem',
+            index=models.Index(fields=['collection', 'start', 'end'], name='djradicale_item_time_range'),
+        ),
+        migrations.RunPython(fill_time_range, migrations.RunPython.noop),
+    ]
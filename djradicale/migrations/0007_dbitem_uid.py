@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:26
+
+import logging
+
+from django.db import migrations, models
+
+from radicale.item import Item
+
+logger = logging.getLogger('djradicale')
+
+
+def fill_uid(apps, schema_editor):
+    DBItem = apps.get_model('djradicale', 'DBItem')
+    for dbitem in DBItem.objects.select_related('collection').iterator():
+        item = Item(collection_path=dbitem.collection.path, text=dbitem.text)
+        try:
+            uid = item.uid
+        except Exception as e:
+            logger.warning('Failed to read the UID of %r: %s', dbitem.name, e)
+            continue
+        if len(uid) <= 255:
+            DBItem.objects.filter(pk=dbitem.pk).update(uid=uid)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0006_dbitem_time_range'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbitem',
+            name='uid',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='UID'),
+        ),
+        migrations.AddIndex(
+            model_name='dbitem',
+            index=models.Index(fields=['collection', 'uid'], name='djradicale_item_uid'),
+        ),
+        migrations.RunPython(fill_uid, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0007_dbitem_uid'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='dbitem',
+            options={'verbose_name': 'Item', 'verbose_name_plural': 'Items'},
+        ),
+        migrations.AlterField(
+            model_name='dbcollection',
+            name='parent_path',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='Parent Path'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dbitem',
+            unique_together={('collection', 'name')},
+        ),
+        migrations.AddIndex(
+            model_name='dbchange',
+            index=models.Index(fields=['collection', 'timestamp'], name='djradicale_change_timestamp'),
+        ),
+    ]
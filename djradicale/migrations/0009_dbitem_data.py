@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0008_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbitem',
+            name='data',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Data'),
+        ),
+        migrations.AlterField(
+            model_name='dbitem',
+            name='text',
+            field=models.TextField(blank=True, verbose_name='Text'),
+        ),
+    ]
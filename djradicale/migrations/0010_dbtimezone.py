@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0009_dbitem_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DBTimezone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True, verbose_name='Digest')),
+                ('text', models.TextField(verbose_name='Text')),
+            ],
+            options={
+                'verbose_name': 'Timezone',
+                'verbose_name_plural': 'Timezones',
+                'db_table': 'djradicale_timezone',
+            },
+        ),
+        migrations.AddField(
+            model_name='dbitem',
+            name='vtimezones',
+            field=models.BooleanField(default=False, verbose_name='Separate VTIMEZONEs'),
+        ),
+    ]
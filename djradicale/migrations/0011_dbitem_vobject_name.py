@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:58
+
+from django.db import migrations, models
+
+
+def fill_vobject_name(apps, schema_editor):
+    # compressed texts are left unset, radicale parses them when needed
+    DBItem = apps.get_model('djradicale', 'DBItem')
+    for dbitem in DBItem.objects.exclude(text='').only('pk', 'text').iterator():
+        line = dbitem.text.lstrip().split('\n', 1)[0].strip()
+        if line.upper().startswith('BEGIN:') and len(line) <= 32 + 6:
+            DBItem.objects.filter(pk=dbitem.pk).update(
+                vobject_name=line[6:].upper())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djradicale', '0010_dbtimezone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbitem',
+            name='vobject_name',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='Object Name'),
+        ),
+        migrations.RunPython(fill_vobject_name, migrations.RunPython.noop),
+    ]
@@ -16,25 +16,190 @@
 
 import json
 import re
+import zlib
+
+from hashlib import sha256
 
 from django.conf import settings
 from django.urls import reverse
-from django.db import models
+from django.utils.http import http_date
+from django.utils import timezone
+from django.db import models, transaction
 from django.db.models import Q
 
-from radicale.item import Item
+from .item import Item
+
+
+# number of rows read at a time when streaming items, the default of the
+# storage's chunk_size option
+CHUNK_SIZE = 2000
+
+# first byte of DBItem.data, telling how the rest is encoded
+DATA_ZLIB = b'\x01'
+
+
+def compress_text(text):
+    return DATA_ZLIB + zlib.compress(text.encode())
+
+
+def decompress_text(data):
+    data = bytes(data)
+    if data[:1] == DATA_ZLIB:
+        return zlib.decompress(data[1:]).decode()
+    raise ValueError('Unknown item data format: %r' % data[:1])
+
+
+VTIMEZONE_RE = re.compile(
+    r'^BEGIN:VTIMEZONE\r?\n.*?^END:VTIMEZONE\r?\n', re.MULTILINE | re.DOTALL)
+VTIMEZONE_MARKER = 'X-DJRADICALE-VTIMEZONE:'
+VTIMEZONE_MARKER_RE = re.compile(
+    r'^X-DJRADICALE-VTIMEZONE:([0-9a-f]{64})\r\n', re.MULTILINE)
+
+# maximal number of timezone texts kept in memory
+TIMEZONE_CACHE_SIZE = 1000
+
+# digest -> text of the timezones read so far, content-addressed entries
+# are never stale
+_timezone_texts = {}
+
+
+def split_timezones(text):
+    """
+    Replace the VTIMEZONE blocks of ``text`` with markers.
+
+    Returns the new text and the blocks by their digest.
+    """
+    timezones = {}
+
+    def replace(match):
+        digest = sha256(match.group(0).encode()).hexdigest()
+        timezones[digest] = match.group(0)
+        return '%s%s\r\n' % (VTIMEZONE_MARKER, digest)
+
+    return VTIMEZONE_RE.sub(replace, text), timezones
+
+
+def join_timezones(text):
+    """
+    Put the VTIMEZONE blocks back in place of the markers of ``text``.
+    """
+    texts = DBTimezone.objects.get_texts(VTIMEZONE_MARKER_RE.findall(text))
+    return VTIMEZONE_MARKER_RE.sub(lambda m: texts[m.group(1)], text)
 
 
 class DBCollectionQuerySet(models.query.QuerySet):
-    def as_collections(self):
+    def as_collections(self, storage=None):
         for c in self:
-            yield c.as_collection()
+            yield c.as_collection(storage)
+
+    def with_properties(self):
+        """
+        Fetch the properties together with the collections.
+        """
+        return self.annotate(properties_text=models.Subquery(
+            DBProperties.objects.filter(
+                path=models.OuterRef('path')).values('text')[:1]))
+
+    def touch(self, change):
+        """
+        Mark the collections as modified.
+
+        New ETags are derived from the current ETag and a description of
+        the ``change``, without looking at the items.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            for pk, path, etag in self.select_for_update().values_list(
+                    'pk', 'path', 'etag'):
+                new_etag = sha256(
+                    ('%s\n%s\n%s' % (etag, path, change)).encode()).hexdigest()
+                self.model.objects.filter(pk=pk).update(
+                    etag='"%s"' % new_etag, last_modified=now)
 
 
 class DBItemQuerySet(models.query.QuerySet):
-    def as_items(self):
-        for i in self:
-            yield i.as_item()
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        DBItem.store_timezones(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, *args, **kwargs):
+        objs = list(objs)
+        DBItem.store_timezones(objs)
+        return super().bulk_update(objs, *args, **kwargs)
+
+    def as_items(self, collection=None, chunk_size=CHUNK_SIZE):
+        """
+        Yield radicale items, fetching the rows ``chunk_size`` at a time
+        (or the chunk size of the ``collection``) without caching them.
+        """
+        if collection is not None:
+            for i in self.iterator(collection.chunk_size):
+                yield i.as_item(collection)
+            return
+
+        # share one Collection per path instead of a query per item
+        collections = {}
+        for i in self.select_related('collection').iterator(chunk_size):
+            if i.collection_id not in collections:
+                collections[i.collection_id] = i.collection.as_collection()
+            yield i.as_item(collections[i.collection_id])
+
+
+class DBChangeQuerySet(models.query.QuerySet):
+    def record(self, collection_id, name, deleted=False):
+        """
+        Log a change of the item ``name``.
+
+        Only the latest change of each item is kept.
+        """
+        self.filter(collection_id=collection_id, name=name).delete()
+        return self.create(collection_id=collection_id, name=name, deleted=deleted)
+
+    def expire(self, collection_id, before):
+        """
+        Drop changes logged before ``before`` and invalidate sync tokens
+        referring to them.
+        """
+        expired = self.filter(collection_id=collection_id, timestamp__lt=before)
+        token = expired.aggregate(token=models.Max('id'))['token']
+        if token is not None:
+            expired.delete()
+            DBCollection.objects.filter(
+                pk=collection_id, min_sync_token__lt=token,
+            ).update(min_sync_token=token)
+
+
+class DBTimezoneQuerySet(models.query.QuerySet):
+    def store(self, timezones):
+        """
+        Store the ``{digest: text}`` timezones that are not stored yet.
+        """
+        if timezones:
+            self.bulk_create(
+                [DBTimezone(digest=d, text=t) for d, t in timezones.items()],
+                ignore_conflicts=True)
+
+    def get_texts(self, digests):
+        """
+        Return the texts of the timezones by their digest.
+        """
+        texts = {}
+        for digest in digests:
+            if digest in _timezone_texts:
+                texts[digest] = _timezone_texts[digest]
+        missing = set(digests).difference(texts)
+        if missing:
+            loaded = dict(self.filter(
+                digest__in=missing).values_list('digest', 'text'))
+            if missing.difference(loaded):
+                raise ValueError('Unknown timezones: %s' % ', '.join(
+                    sorted(missing.difference(loaded))))
+            if len(_timezone_texts) + len(loaded) > TIMEZONE_CACHE_SIZE:
+                _timezone_texts.clear()
+            _timezone_texts.update(loaded)
+            texts.update(loaded)
+        return texts
 
 
 class DBCollection(models.Model):
@@ -43,16 +208,14 @@ class DBCollection(models.Model):
     """
     objects = DBCollectionQuerySet.as_manager()
     path = models.CharField('Path', max_length=255, unique=True)
-    parent_path = models.TextField('Parent Path')
+    parent_path = models.CharField('Parent Path', max_length=255, db_index=True)
+    etag = models.CharField('ETag', max_length=255, blank=True)
+    min_sync_token = models.BigIntegerField('Minimal Sync Token', default=0)
+    last_modified = models.DateTimeField('Last Modified', null=True, blank=True)
 
     def get_absolute_url(self):
         return reverse('djradicale:application', kwargs={'url': self.path})
 
-    @property
-    def last_modified(self):
-        if self.items.exists():
-            return self.items.latest('timestamp').timestamp
-
     @property
     def tag(self):
         try:
@@ -66,9 +229,13 @@ class DBCollection(models.Model):
     def __unicode__(self):
         return self.path
 
-    def as_collection(self):
+    def as_collection(self, storage=None):
         from .storage import Collection
-        return Collection(self.path)
+        meta = None
+        if hasattr(self, 'properties_text'):
+            meta = json.loads(self.properties_text or '{}')
+        return Collection(self.path, storage=storage, collection_id=self.pk,
+                          meta=meta, etag=self.etag)
 
     class Meta(object):
         db_table = 'djradicale_collection'
@@ -86,7 +253,20 @@ class DBItem(models.Model):
         'DBCollection', verbose_name='Collection', related_name='items',
         on_delete=models.CASCADE)
     name = models.CharField('Name', max_length=255)
-    text = models.TextField('Text')
+    text = models.TextField('Text', blank=True)
+    # compressed text, replaces ``text`` when set
+    data = models.BinaryField('Data', null=True, blank=True)
+    # the VTIMEZONEs of the text are replaced with DBTimezone markers
+    vtimezones = models.BooleanField('Separate VTIMEZONEs', default=False)
+    etag = models.CharField('ETag', max_length=255, blank=True)
+    uid = models.CharField('UID', max_length=255, null=True, blank=True)
+    # name of the top level object, e.g. VCALENDAR, VCARD or VLIST
+    vobject_name = models.CharField(
+        'Object Name', max_length=32, null=True, blank=True)
+    component_name = models.CharField(
+        'Component Name', max_length=32, null=True, blank=True)
+    start = models.BigIntegerField('Start', null=True, blank=True)
+    end = models.BigIntegerField('End', null=True, blank=True)
     timestamp = models.DateTimeField('Timestamp', auto_now=True)
 
     def get_absolute_url(self):
@@ -101,18 +281,84 @@ class DBItem(models.Model):
         return self.name
 
     def _get_field(self, field):
-        for line in self.text.split('\n'):
+        for line in self.get_text().split('\n'):
             if line.startswith(field + ':'):
                 return line[len(field + ':'):]
 
-    def as_item(self):
-        collection = self.collection.as_collection()
+    def get_text(self):
+        text = self.text
+        if self.data is not None:
+            text = decompress_text(self.data)
+        if self.vtimezones:
+            text = join_timezones(text)
+        return text
+
+    def set_text(self, text, compress=False, deduplicate=False):
+        """
+        Set the text, compressed and with the VTIMEZONEs stored separately
+        if asked to. The VTIMEZONEs are saved together with the item.
+        """
+        self._timezones = {}
+        # texts containing markers already are kept as they are
+        if deduplicate and VTIMEZONE_MARKER not in text:
+            text, self._timezones = split_timezones(text)
+        self.vtimezones = bool(self._timezones)
+        if compress:
+            self.text, self.data = '', compress_text(text)
+        else:
+            self.text, self.data = text, None
+
+    @staticmethod
+    def store_timezones(dbitems):
+        timezones = {}
+        for i in dbitems:
+            timezones.update(getattr(i, '_timezones', {}))
+            i._timezones = {}
+        DBTimezone.objects.store(timezones)
+
+    def save(self, *args, **kwargs):
+        self.store_timezones([self])
+        super().save(*args, **kwargs)
+
+    def set_item(self, item, compress=False, deduplicate=False):
+        """
+        Store the text of ``item`` together with the values derived from it.
+        """
+        self.set_text(item.serialize(), compress, deduplicate)
+        self.etag = item.etag
+        self.uid = item.uid if len(item.uid) <= 255 else None
+        self.vobject_name = item.name
+        self.component_name = item.component_name
+        self.start, self.end = item.time_range
+
+    def _load_text(self):
+        self.refresh_from_db(fields=['text', 'data'])
+        return self.get_text()
+
+    def as_item(self, collection=None):
+        """
+        Return the radicale item. If ``text`` was deferred, it is only
+        fetched once the item needs it.
+        """
+        if collection is None:
+            collection = self.collection.as_collection()
+        if 'text' in self.get_deferred_fields():
+            text, text_loader = None, self._load_text
+        else:
+            text, text_loader = self.get_text(), None
         return Item(
             collection=collection,
             collection_path=collection.path,
             href=self.name,
-            text=self.text,
-            last_modified=self.timestamp.timestamp
+            text=text,
+            text_loader=text_loader,
+            etag=self.etag or None,
+            uid=self.uid,
+            name=self.vobject_name,
+            component_name=self.component_name,
+            time_range=None if self.start is None else (self.start, self.end),
+            last_modified=http_date(self.timestamp.timestamp()),
+            parse_cache=collection.parse_cache,
         )
 
     @property
@@ -125,10 +371,62 @@ class DBItem(models.Model):
 
     class Meta(object):
         db_table = 'djradicale_item'
-        ordering = 'timestamp',
         verbose_name = 'Item'
         verbose_name_plural = 'Items'
-        unique_together = 'name', 'collection'
+        # collection first, so the index also serves whole collection lookups
+        unique_together = 'collection', 'name'
+        indexes = [
+            models.Index(fields=['collection', 'start', 'end'],
+                         name='djradicale_item_time_range'),
+            models.Index(fields=['collection', 'uid'], name='djradicale_item_uid'),
+        ]
+
+
+class DBChange(models.Model):
+    """
+    Table of changes of collection's items.
+
+    The primary key is used as a WebDAV sync token.
+    """
+    objects = DBChangeQuerySet.as_manager()
+
+    collection = models.ForeignKey(
+        'DBCollection', verbose_name='Collection', related_name='changes',
+        on_delete=models.CASCADE)
+    name = models.CharField('Name', max_length=255)
+    deleted = models.BooleanField('Deleted', default=False)
+    timestamp = models.DateTimeField('Timestamp', auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta(object):
+        db_table = 'djradicale_change'
+        verbose_name = 'Change'
+        verbose_name_plural = 'Changes'
+        indexes = [
+            models.Index(fields=['collection', 'id'], name='djradicale_change_token'),
+            models.Index(fields=['collection', 'timestamp'],
+                         name='djradicale_change_timestamp'),
+        ]
+
+
+class DBTimezone(models.Model):
+    """
+    Table of VTIMEZONE blocks shared by items, addressed by their digest.
+    """
+    objects = DBTimezoneQuerySet.as_manager()
+
+    digest = models.CharField('Digest', max_length=64, unique=True)
+    text = models.TextField('Text')
+
+    def __str__(self):
+        return self.digest
+
+    class Meta(object):
+        db_table = 'djradicale_timezone'
+        verbose_name = 'Timezone'
+        verbose_name_plural = 'Timezones'
 
 
 class DBProperties(models.Model):
@@ -147,3 +445,7 @@ class DBProperties(models.Model):
         db_table = 'djradicale_properties'
         verbose_name = 'Properties'
         verbose_name_plural = 'Properties'
+
+
+# connect the signal handlers together with the models
+from . import signals  # noqa: E402,F401
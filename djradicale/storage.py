@@ -16,141 +16,642 @@
 
 import json
 import os
+import uuid
+import hashlib
 import logging
 import datetime
 
 from contextlib import contextmanager
+from contextvars import ContextVar
 
 from django.conf import settings
-from django.db import transaction
-from django.db.models import Q
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
 
 from radicale import types
+from radicale.config import positive_int
+from radicale.item import filter as radicale_filter
+from radicale.item import find_available_uid, get_etag
 from radicale.storage import BaseCollection, BaseStorage
-from radicale.pathutils import strip_path, unstrip_path
+from radicale.pathutils import is_safe_path_component, strip_path, unstrip_path
 
-from .models import DBCollection, DBItem, DBProperties
+from .item import ParseCache
+from .models import CHUNK_SIZE, DBChange, DBCollection, DBItem, DBProperties
 
 logger = logging.getLogger('djradicale')
 
 
+def nonzero_int(value):
+    value = positive_int(value)
+    if value == 0:
+        raise ValueError('value must be greater than zero')
+    return value
+
+
+PLUGIN_CONFIG_SCHEMA = {
+    'storage': {
+        'parse_cache_size': {
+            'value': '4194304',
+            'help': 'total size in bytes of item texts kept parsed in memory',
+            'type': positive_int,
+        },
+        'parse_cache_alias': {
+            'value': '',
+            'help': 'django cache sharing parsed items between processes',
+            'type': str,
+        },
+        'compress': {
+            'value': 'False',
+            'help': 'store the texts of new items compressed',
+            'type': bool,
+        },
+        'deduplicate_timezones': {
+            'value': 'False',
+            'help': 'store the VTIMEZONEs of new items once, shared by items',
+            'type': bool,
+        },
+        'chunk_size': {
+            'value': str(CHUNK_SIZE),
+            'help': 'number of items fetched from the database at a time',
+            'type': nonzero_int,
+        },
+        'meta_cache_alias': {
+            'value': '',
+            'help': 'django cache sharing collection metadata between processes',
+            'type': str,
+        },
+        'meta_cache_ttl': {
+            'value': '300',
+            'help': 'seconds to keep collection metadata in the django cache',
+            'type': positive_int,
+        },
+    },
+}
+
+SYNC_TOKEN_PREFIX = 'http://radicale.org/ns/sync/'
+
+# number of rows written per query by bulk operations
+BULK_SIZE = 500
+
+# set while a request holds the write lock, collections are then locked
+# one by one as they are discovered
+_write_lock = ContextVar('djradicale_write_lock', default=False)
+
+# the DiscoverMemo of the current request, see request_scope()
+_discover_memo = ContextVar('djradicale_discover_memo', default=None)
+
+
+class DiscoverMemo(object):
+    """
+    Results of the depth 0 ``discover()`` calls of a request, by path.
+    """
+    def __init__(self):
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+
+@contextmanager
+def request_scope():
+    """
+    Share the results of ``discover()`` between the calls made while
+    handling one request. Writes of the request start over.
+    """
+    memo = DiscoverMemo()
+    token = _discover_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _discover_memo.reset(token)
+        logger.debug('discover() memo of the request: %d hits, %d misses',
+                     memo.hits, memo.misses)
+
+
+def forget_discovered():
+    memo = _discover_memo.get()
+    if memo is not None:
+        memo.results.clear()
+
+
+class MetaCache(object):
+    """
+    Collection rows (primary key, properties and ETag) shared between
+    processes in a django cache, by path.
+
+    Entries are stored under a version stamp of their path which writes
+    replace once committed, so a request that read the database before the
+    write can't store stale metadata under the current version.
+    """
+    MISSING = object()
+
+    def __init__(self, cache_alias, ttl):
+        self.cache = caches[cache_alias]
+        self.ttl = ttl
+
+    def _key(self, kind, path):
+        digest = hashlib.sha256(path.encode()).hexdigest()
+        return 'djradicale:collection:%s:%s' % (kind, digest)
+
+    @property
+    def version_ttl(self):
+        # outlives the entries, a lost stamp only turns them into misses
+        return self.ttl * 2
+
+    def get(self, path, load):
+        """
+        Return the entry of ``path``, calling ``load()`` on a miss.
+
+        Entries are ``None`` when there is no collection at ``path``, those
+        aren't stored, e.g. for the paths of items.
+        """
+        version_key = self._key('version', path)
+        version = self.cache.get(version_key)
+        if version is not None:
+            entry = self.cache.get(
+                '%s:%s' % (self._key('data', path), version), self.MISSING)
+            if entry is not self.MISSING:
+                return entry
+        entry = load()
+        if entry is None:
+            return None
+        if version is None:
+            # stamped after loading, fails if a write replaced the stamp
+            # meanwhile
+            version = uuid.uuid4().hex
+            if not self.cache.add(version_key, version, self.version_ttl):
+                return entry
+        self.cache.set(
+            '%s:%s' % (self._key('data', path), version), entry, self.ttl)
+        return entry
+
+    def invalidate(self, path):
+        """
+        Drop the entry of ``path`` when the current transaction commits.
+        """
+        transaction.on_commit(lambda: self.cache.set(
+            self._key('version', path), uuid.uuid4().hex, self.version_ttl))
+
+
+def chunks(iterable, size):
+    chunk = []
+    for i in iterable:
+        chunk.append(i)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 class Collection(BaseCollection):
-    def __init__(self, path, **kwargs):
+    def __init__(self, path, storage=None, collection_id=None, meta=None,
+                 etag=None, **kwargs):
         self._path = path
+        self._storage = storage
+        self._collection_id = collection_id
+        self._meta = meta
+        # the stored ETag, if known; forgotten after writes
+        self._stored_etag = etag or None
 
     @property
     def path(self):
         return self._path
 
+    @property
+    def parse_cache(self):
+        if self._storage is not None:
+            return self._storage.parse_cache
+
+    @property
+    def compress(self):
+        if self._storage is not None:
+            return self._storage.configuration.get('storage', 'compress')
+        return False
+
+    @property
+    def deduplicate_timezones(self):
+        if self._storage is not None:
+            return self._storage.configuration.get(
+                'storage', 'deduplicate_timezones')
+        return False
+
+    @property
+    def chunk_size(self):
+        if self._storage is not None:
+            return self._storage.configuration.get('storage', 'chunk_size')
+        return CHUNK_SIZE
+
+    @property
+    def meta_cache(self):
+        # the database is read directly under the write lock, entries
+        # must reflect committed data only
+        if self._storage is not None and not _write_lock.get():
+            return self._storage.meta_cache
+
+    def _forget_cached(self):
+        forget_discovered()
+        if self._storage is not None and self._storage.meta_cache is not None:
+            self._storage.meta_cache.invalidate(self.path)
+
+    def _load_cached(self):
+        """
+        Fill in the stored values from the meta cache, if enabled.
+        """
+        if self.meta_cache is None:
+            return
+        entry = self.meta_cache.get(
+            self.path, lambda: self._storage._load_collection(self.path))
+        if entry is None:
+            return
+        if self._collection_id is None:
+            self._collection_id = entry['id']
+        if self._meta is None:
+            self._meta = dict(entry['meta'])
+        if self._stored_etag is None:
+            self._stored_etag = entry['etag'] or None
+
+    @property
+    def collection_id(self):
+        """
+        Primary key of the stored collection, ``None`` if there is none.
+        """
+        if self._collection_id is None:
+            self._load_cached()
+        if self._collection_id is None:
+            self._collection_id = DBCollection.objects.filter(
+                path=self.path).values_list('pk', flat=True).first()
+        return self._collection_id
+
+    def _items(self):
+        if self.collection_id is None:
+            return DBItem.objects.none()
+        return DBItem.objects.filter(collection_id=self.collection_id)
+
     def get_all(self):
-        q = Q(collection__path=self.path)
-        return DBItem.objects.filter(q).as_items()
+        return self._items().as_items(self)
 
     def get_multi(self, hrefs):
-        q = Q(collection__path=self.path, name__in=hrefs)
-        for i in DBItem.objects.filter(q).as_items():
-            yield (i.href, i)
+        # duplicates are dropped, the request order is kept
+        hrefs = list(dict.fromkeys(hrefs))
+        if self.collection_id is None:
+            for href in hrefs:
+                yield href, None
+            return
+        for chunk in chunks(hrefs, BULK_SIZE):
+            items = {i.href: i for i in self._items().filter(
+                name__in=chunk).as_items(self)}
+            for href in chunk:
+                yield href, items.get(href)
+
+    def get_filtered(self, filters):
+        tag = self.tag
+        if not tag:
+            return
+        tag, start, end, simple = radicale_filter.simplify_prefilters(
+            filters, tag)
+
+        # items stored without the computed fields are checked below
+        q = Q()
+        if tag is not None:
+            q &= Q(component_name=tag) | Q(component_name__isnull=True)
+        if (start, end) != (radicale_filter.TIMESTAMP_MIN,
+                            radicale_filter.TIMESTAMP_MAX):
+            q &= Q(start__lt=end, end__gt=start) | Q(start__isnull=True)
+
+        for item in self._items().filter(q).as_items(self):
+            if tag is not None and tag != item.component_name:
+                continue
+            istart, iend = item.time_range
+            if istart >= end or iend <= start:
+                continue
+            yield item, simple and (start <= istart or iend <= end)
 
     def has_uid(self, uid):
-        q = Q(collection__path=self.path, name=uid)
-        return DBItem.objects.filter(q).exists()
+        if len(uid) > 255:
+            return super().has_uid(uid)
+        return self._items().filter(uid=uid).exists()
 
     def upload(self, href, item):
-        try:
-            dbcollection = DBCollection.objects.get(path=self.path)
-            dbitem, _ = DBItem.objects.get_or_create(
-                collection=dbcollection,
-                name=href
-            )
-            dbitem.text = item.serialize()
-            dbitem.save()
-        except DBCollection.DoesNotExist:
-            pass
-        else:
-            return item
+        if self.collection_id is None:
+            return
+        dbitem, _ = DBItem.objects.get_or_create(
+            collection_id=self.collection_id,
+            name=href
+        )
+        dbitem.set_item(item, self.compress, self.deduplicate_timezones)
+        dbitem.save()
+        self._item_changed(self.collection_id, href, item.etag)
+        return item
 
     def delete(self, href=None):
         if href is None:
             DBItem.objects.filter(collection__path=self.path).delete()
             DBCollection.objects.filter(path=self.path).delete()
             DBProperties.objects.filter(path=self.path).delete()
+            self._collection_id = self._meta = self._stored_etag = None
+            self._forget_cached()
         else:
-            DBItem.objects.filter(collection__path=self.path, name=href).delete()
+            deleted, _ = self._items().filter(name=href).delete()
+            if deleted:
+                self._item_changed(self.collection_id, href)
+
+    def _item_changed(self, collection_id, href, etag=None):
+        """
+        Update the collection's ETag and sync log after the item ``href``
+        was uploaded (``etag`` is set) or deleted.
+        """
+        DBCollection.objects.filter(pk=collection_id).touch(
+            '%s/%s' % (href, etag or ''))
+        self._stored_etag = None
+        self._forget_cached()
+        DBChange.objects.record(collection_id, href, deleted=etag is None)
+        self._expire_changes(collection_id)
+
+    def _expire_changes(self, collection_id):
+        if self._storage is not None:
+            max_age = self._storage.configuration.get(
+                'storage', 'max_sync_token_age')
+            DBChange.objects.expire(
+                collection_id,
+                timezone.now() - datetime.timedelta(seconds=max_age))
+
+    def upload_all_nonatomic(self, items, suffix=''):
+        """
+        Upload a new set of items in bulk, without existence checks.
+
+        Items are named after their UID like radicale's multifilesystem
+        storage does.
+        """
+        collection_id = self.collection_id
+        hrefs = set()
+        for chunk in chunks(items, BULK_SIZE):
+            dbitems = []
+            for item in chunk:
+                href = self._find_href(item.uid, suffix, hrefs)
+                hrefs.add(href)
+                dbitem = DBItem(collection_id=collection_id, name=href)
+                dbitem.set_item(
+                    item, self.compress, self.deduplicate_timezones)
+                dbitems.append(dbitem)
+            names = [i.name for i in dbitems]
+            DBItem.objects.bulk_create(dbitems)
+            DBChange.objects.filter(
+                collection_id=collection_id, name__in=names).delete()
+            DBChange.objects.bulk_create(
+                DBChange(collection_id=collection_id, name=name) for name in names)
+            DBCollection.objects.filter(pk=collection_id).touch(
+                '\n'.join('%s/%s' % (i.name, i.etag) for i in dbitems))
+            self._stored_etag = None
+        self._forget_cached()
+        self._expire_changes(collection_id)
+
+    @staticmethod
+    def _find_href(uid, suffix, hrefs):
+        candidates = (
+            uid if uid.lower().endswith(suffix.lower()) else uid + suffix,
+            get_etag(uid).strip('"') + suffix,
+        )
+        for href in candidates:
+            if (href not in hrefs and len(href) <= 255 and
+                    is_safe_path_component(href)):
+                return href
+        return find_available_uid(hrefs.__contains__, suffix)
+
+    def sync(self, old_token=''):
+        try:
+            dbcollection = DBCollection.objects.get(path=self.path)
+        except DBCollection.DoesNotExist:
+            return super().sync(old_token)
+        self._collection_id = dbcollection.pk
 
-    def get_meta(self, key=None):
+        changes = DBChange.objects.filter(collection=dbcollection)
+        token = changes.aggregate(token=Max('id'))['token']
+        token = max(token or 0, dbcollection.min_sync_token)
+
+        if not old_token:
+            names = DBItem.objects.filter(
+                collection=dbcollection).values_list('name', flat=True)
+            return SYNC_TOKEN_PREFIX + str(token), names
+
+        if not old_token.startswith(SYNC_TOKEN_PREFIX):
+            raise ValueError('Malformed token: %r' % old_token)
         try:
-            p = DBProperties.objects.get(path=self.path)
-            meta = json.loads(p.text)
-            if key is None:
-                return meta
-            else:
-                return meta.get(key)
+            old_token = int(old_token[len(SYNC_TOKEN_PREFIX):])
+        except ValueError:
+            raise ValueError('Malformed token: %r' % old_token)
+        if old_token < dbcollection.min_sync_token:
+            raise ValueError('Token expired: %r' % old_token)
 
-        except DBProperties.DoesNotExist:
-            if key is None:
-                return {}
+        names = changes.filter(id__gt=old_token).values_list('name', flat=True)
+        return SYNC_TOKEN_PREFIX + str(token), names
+
+    def get_meta(self, key=None):
+        # loaded once per instance, i.e. per request
+        if self._meta is None:
+            self._load_cached()
+        if self._meta is None:
+            try:
+                p = DBProperties.objects.get(path=self.path)
+                self._meta = json.loads(p.text)
+            except DBProperties.DoesNotExist:
+                self._meta = {}
+        if key is None:
+            return dict(self._meta)
+        return self._meta.get(key)
 
     def set_meta(self, props):
         p, created = DBProperties.objects.get_or_create(path=self.path)
         p.text = json.dumps(props)
         p.save()
+        self._meta = dict(props)
+        DBCollection.objects.filter(path=self.path).touch(
+            json.dumps(props, sort_keys=True))
+        self._stored_etag = None
+        self._forget_cached()
 
     @property
-    def last_modified(self):
+    def etag(self):
+        if self._stored_etag is None:
+            self._load_cached()
+        if self._stored_etag is not None:
+            return self._stored_etag
         try:
-            collection = DBCollection.objects.get(path=self.path)
+            etag = DBCollection.objects.values_list(
+                'etag', flat=True).get(path=self.path)
         except DBCollection.DoesNotExist:
-            pass
-        else:
-            if collection.last_modified:
-                return datetime.datetime.strftime(
-                    collection.last_modified, '%a, %d %b %Y %H:%M:%S %z')
+            return super().etag
+        if not etag:
+            # computed once from the items, maintained on writes afterwards
+            etag = super().etag
+            DBCollection.objects.filter(path=self.path, etag='').update(etag=etag)
+            self._forget_cached()
+        self._stored_etag = etag
+        return etag
+
+    @property
+    def last_modified(self):
+        last_modified = DBCollection.objects.filter(
+            path=self.path).values_list('last_modified', flat=True).first()
+        if last_modified:
+            return datetime.datetime.strftime(
+                last_modified, '%a, %d %b %Y %H:%M:%S %z')
 
 
 class Storage(BaseStorage):
+    def __init__(self, configuration):
+        super().__init__(configuration.copy(PLUGIN_CONFIG_SCHEMA))
+        parse_cache_size = self.configuration.get('storage', 'parse_cache_size')
+        parse_cache_alias = self.configuration.get('storage', 'parse_cache_alias')
+        self.parse_cache = None
+        if parse_cache_size or parse_cache_alias:
+            self.parse_cache = ParseCache(parse_cache_size, parse_cache_alias)
+        meta_cache_alias = self.configuration.get('storage', 'meta_cache_alias')
+        self.meta_cache = None
+        if meta_cache_alias:
+            self.meta_cache = MetaCache(
+                meta_cache_alias,
+                self.configuration.get('storage', 'meta_cache_ttl'))
+
     def discover(self, path, depth='0'):
+        memo = _discover_memo.get()
+        if memo is None or depth != '0':
+            return self._discover(path, depth)
+        stripped_path = strip_path(path)
+        if stripped_path in memo.results:
+            memo.hits += 1
+        else:
+            memo.misses += 1
+            memo.results[stripped_path] = list(self._discover(path, depth))
+        return iter(memo.results[stripped_path])
+
+    @staticmethod
+    def _load_collection(path):
+        """
+        Entry of the meta cache for ``path``.
+        """
+        c = DBCollection.objects.filter(path=path).with_properties().first()
+        if c is None:
+            return None
+        return {
+            'id': c.pk,
+            'meta': json.loads(c.properties_text or '{}'),
+            'etag': c.etag,
+        }
+
+    def _discover(self, path, depth):
         stripped_path = strip_path(path)
 
         if stripped_path == '':
-            yield Collection('')
+            yield Collection('', storage=self)
             return
 
-        for c in DBCollection.objects.filter(path=stripped_path).as_collections():
-            yield c
-
-        prefix, _, name = stripped_path.rpartition('/')
-        for i in DBItem.objects.filter(collection__path=prefix, name=name).as_items():
-            yield i
+        collection = None
+        if self.meta_cache is not None and not _write_lock.get():
+            entry = self.meta_cache.get(
+                stripped_path, lambda: self._load_collection(stripped_path))
+            if entry is not None:
+                collection = Collection(
+                    stripped_path, storage=self, collection_id=entry['id'],
+                    meta=dict(entry['meta']), etag=entry['etag'])
+                yield collection
+        else:
+            collections = DBCollection.objects.filter(path=stripped_path)
+            if _write_lock.get():
+                collections = collections.select_for_update()
+            for c in collections.with_properties().as_collections(self):
+                collection = c
+                yield c
+
+        if collection is None:
+            prefix, _, name = stripped_path.rpartition('/')
+            if _write_lock.get():
+                # the item is read under the lock of its collection
+                list(DBCollection.objects.select_for_update().filter(
+                    path=prefix).values_list('pk', flat=True))
+            q = Q(collection__path=prefix, name=name)
+            for i in DBItem.objects.filter(q).as_items(
+                    Collection(prefix, storage=self)):
+                yield i
+            return
 
         if depth == '0':
             return
 
-        for i in DBItem.objects.filter(collection__path=stripped_path).as_items():
+        # radicale keeps items in tagged collections and child collections
+        # in untagged ones only
+        if not collection.tag:
+            children = DBCollection.objects.filter(parent_path=stripped_path)
+            for c in children.with_properties().as_collections(self):
+                yield c
+            return
+
+        # PROPFIND mostly asks for stored values, the texts are fetched
+        # one by one if it needs them
+        for i in collection._items().defer('text', 'data').as_items(collection):
             yield i
 
     def move(self, item, to_collection, to_href):
+        to_collection_id = to_collection.collection_id
+        if to_collection_id is None:
+            return
         try:
-            dbcollection = DBCollection.objects.get(path=to_collection._path)
-            dbitem = DBItem.objects.get(collection__path=item.collection._path, name=item.href)
-        except DBCollection.DoesNotExist:
-            pass
+            dbitem = item.collection._items().get(name=item.href)
         except DBItem.DoesNotExist:
-            pass
-        else:
-            dbitem.collection = dbcollection
-            dbitem.name = to_href
-            dbitem.save()
-
-    def create_collection(self, href, collection=None, props=None):
+            return
+        from_collection_id = dbitem.collection_id
+        DBItem.objects.filter(collection_id=to_collection_id, name=to_href).delete()
+        dbitem.collection_id = to_collection_id
+        dbitem.name = to_href
+        dbitem.save()
+        item.collection._item_changed(from_collection_id, item.href)
+        to_collection._item_changed(to_collection_id, to_href, dbitem.etag)
+
+    def create_collection(self, href, items=None, props=None):
         stripped_path = strip_path(href)
 
-        c, created = DBCollection.objects.get_or_create(
-            path=stripped_path,
-            parent_path=os.path.dirname(stripped_path))
-
-        return c.as_collection()
+        with transaction.atomic():
+            c, created = DBCollection.objects.get_or_create(
+                path=stripped_path,
+                defaults={'parent_path': os.path.dirname(stripped_path)})
+            collection = c.as_collection(self)
+            collection._forget_cached()
+            if not props:
+                return collection
+
+            # replace the existing collection, keeping deletions visible
+            # to clients syncing it
+            names = list(DBItem.objects.filter(collection=c).values_list('name', flat=True))
+            for chunk in chunks(names, BULK_SIZE):
+                DBItem.objects.filter(collection=c, name__in=chunk).delete()
+                DBChange.objects.filter(collection=c, name__in=chunk).delete()
+                DBChange.objects.bulk_create(
+                    DBChange(collection=c, name=name, deleted=True) for name in chunk)
+            collection.set_meta(props)
+            if items is not None:
+                if props.get('tag') == 'VCALENDAR':
+                    collection.upload_all_nonatomic(items, suffix='.ics')
+                elif props.get('tag') == 'VADDRESSBOOK':
+                    collection.upload_all_nonatomic(items, suffix='.vcf')
+
+        return collection
 
     @types.contextmanager
     def acquire_lock(self, mode, user):
-        with transaction.atomic():
+        if mode == 'r':
+            # every query reads committed data on its own
             yield
+            return
+        with transaction.atomic():
+            if connection.vendor == 'sqlite':
+                # take the database wide write lock now, waiting for other
+                # writers, instead of failing when upgrading a read lock
+                with connection.cursor() as cursor:
+                    cursor.execute('UPDATE %s SET id = id WHERE 0' % (
+                        DBCollection._meta.db_table))
+            token = _write_lock.set(True)
+            try:
+                yield
+            finally:
+                _write_lock.reset(token)
@@ -0,0 +1,145 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+import copy
+
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from radicale import config
+
+from djradicale.models import DBChange, DBCollection, DBItem, DBProperties
+from djradicale.storage import Collection, Storage
+
+
+VCARD = '''BEGIN:VCARD
+VERSION:3.0
+UID:{uid}
+FN:{fn}
+N:{fn};;;;
+END:VCARD
+'''
+
+
+class DBItemAdminTestCase(TestCase):
+    def setUp(self):
+        self.dbcollection = DBCollection.objects.create(
+            path='user/addressbook.vcf', parent_path='user')
+        self.other = DBCollection.objects.create(
+            path='user/other.vcf', parent_path='user')
+        for path in ('user/addressbook.vcf', 'user/other.vcf'):
+            DBProperties.objects.create(path=path, text='{"tag": "VADDRESSBOOK"}')
+        self.dbitem = DBItem.objects.create(
+            collection=self.dbcollection, name='a.vcf',
+            text=VCARD.format(uid='a', fn='A'))
+        self.admin = site._registry[DBItem]
+        self.request = RequestFactory().post('/')
+
+    def sync(self, dbcollection):
+        token, _ = Collection(dbcollection.path).sync()
+        return token
+
+    def changes(self, dbcollection):
+        return list(DBChange.objects.filter(
+            collection=dbcollection).values_list('name', 'deleted'))
+
+    def test_save(self):
+        token = self.sync(self.dbcollection)
+        self.dbitem.text = VCARD.format(uid='a', fn='B')
+        self.admin.save_model(self.request, self.dbitem, None, True)
+        self.assertEqual(self.changes(self.dbcollection), [('a.vcf', False)])
+        self.assertNotEqual(self.sync(self.dbcollection), token)
+        _, names = Collection(self.dbcollection.path).sync(token)
+        self.assertEqual(list(names), ['a.vcf'])
+
+    def test_move(self):
+        etag = Collection(self.dbcollection.path).etag
+        other_etag = Collection(self.other.path).etag
+        self.dbitem.collection = self.other
+        self.admin.save_model(self.request, self.dbitem, None, True)
+        self.assertEqual(self.changes(self.dbcollection), [('a.vcf', True)])
+        self.assertEqual(self.changes(self.other), [('a.vcf', False)])
+        self.assertNotEqual(Collection(self.dbcollection.path).etag, etag)
+        self.assertNotEqual(Collection(self.other.path).etag, other_etag)
+
+    def test_delete(self):
+        etag = Collection(self.dbcollection.path).etag
+        self.admin.delete_model(self.request, self.dbitem)
+        self.assertEqual(self.changes(self.dbcollection), [('a.vcf', True)])
+        self.assertNotEqual(Collection(self.dbcollection.path).etag, etag)
+
+    def test_delete_queryset(self):
+        DBItem.objects.create(
+            collection=self.other, name='b.vcf', text=VCARD.format(uid='b', fn='B'))
+        self.admin.delete_queryset(self.request, DBItem.objects.all())
+        self.assertEqual(self.changes(self.dbcollection), [('a.vcf', True)])
+        self.assertEqual(self.changes(self.other), [('b.vcf', True)])
+
+    def test_meta_cache(self):
+        cache.clear()
+        djradicale_config = copy.deepcopy(settings.DJRADICALE_CONFIG)
+        djradicale_config['storage']['meta_cache_alias'] = 'default'
+        with override_settings(DJRADICALE_CONFIG=djradicale_config):
+            storage = Storage(config.load())
+            collection, = storage.discover('/user/addressbook.vcf/')
+            etag = collection.etag
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.dbitem.text = VCARD.format(uid='a', fn='B')
+                self.admin.save_model(self.request, self.dbitem, None, True)
+            collection, = storage.discover('/user/addressbook.vcf/')
+            self.assertNotEqual(collection.etag, etag)
+
+            properties = DBProperties.objects.get(path='user/addressbook.vcf')
+            properties.text = '{"tag": "VADDRESSBOOK", "D:displayname": "A"}'
+            with self.captureOnCommitCallbacks(execute=True):
+                site._registry[DBProperties].save_model(
+                    self.request, properties, None, True)
+            collection, = storage.discover('/user/addressbook.vcf/')
+            self.assertEqual(collection.get_meta('D:displayname'), 'A')
+
+    def test_properties_delete(self):
+        cache.clear()
+        djradicale_config = copy.deepcopy(settings.DJRADICALE_CONFIG)
+        djradicale_config['storage']['meta_cache_alias'] = 'default'
+        properties_admin = site._registry[DBProperties]
+        with override_settings(DJRADICALE_CONFIG=djradicale_config):
+            storage = Storage(config.load())
+            collection, = storage.discover('/user/addressbook.vcf/')
+            other, = storage.discover('/user/other.vcf/')
+            etags = collection.etag, other.etag
+
+            # renamed, then deleted
+            properties = DBProperties.objects.get(path='user/addressbook.vcf')
+            DBProperties.objects.filter(path='user/other.vcf').delete()
+            properties.path = 'user/other.vcf'
+            with self.captureOnCommitCallbacks(execute=True):
+                properties_admin.save_model(self.request, properties, None, True)
+            collection, = storage.discover('/user/addressbook.vcf/')
+            self.assertIsNone(collection.get_meta('tag'))
+            self.assertNotEqual(collection.etag, etags[0])
+            other, = storage.discover('/user/other.vcf/')
+            self.assertEqual(other.get_meta('tag'), 'VADDRESSBOOK')
+            etags = collection.etag, other.etag
+
+            with self.captureOnCommitCallbacks(execute=True):
+                properties_admin.delete_queryset(
+                    self.request, DBProperties.objects.all())
+            other, = storage.discover('/user/other.vcf/')
+            self.assertIsNone(other.get_meta('tag'))
+            self.assertNotEqual(other.etag, etags[1])
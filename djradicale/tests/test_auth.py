@@ -0,0 +1,85 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from radicale import config
+
+from djradicale.auth import Auth
+
+
+class AuthTestCase(TestCase):
+    def setUp(self):
+        # shared between processes, unlike the default LocMemCache
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        caches = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory,
+        }})
+        caches.enable()
+        self.addCleanup(caches.disable)
+        self.user = User.objects.create_user(username='user', password='password')
+        configuration = config.load()
+        configuration.update({'auth': {'cache_ttl': '300'}}, 'test')
+        self.auth = Auth(configuration)
+
+    def test_login(self):
+        self.assertEqual(self.auth.login('user', 'password'), 'user')
+        self.assertIsNone(self.auth.login('user', 'wrong'))
+        self.assertIsNone(self.auth.login('nobody', 'password'))
+
+    def test_login_is_cached(self):
+        self.auth.login('user', 'password')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.auth.login('user', 'password'), 'user')
+        # failed logins are never remembered
+        self.assertIsNone(self.auth.login('user', 'wrong'))
+        self.assertIsNone(self.auth.login('user', 'wrong'))
+
+    def test_password_change(self):
+        self.auth.login('user', 'password')
+        self.user.set_password('secret')
+        self.user.save()
+        self.assertIsNone(self.auth.login('user', 'password'))
+        self.assertEqual(self.auth.login('user', 'secret'), 'user')
+
+    def test_deactivation(self):
+        self.auth.login('user', 'password')
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.auth.login('user', 'password'))
+
+    def test_cache_disabled(self):
+        auth = Auth(config.load())
+        auth.login('user', 'password')
+        with self.assertNumQueries(1):
+            self.assertEqual(auth.login('user', 'password'), 'user')
+
+    def test_local_cache_refused(self):
+        configuration = config.load()
+        configuration.update({'auth': {'cache_ttl': '300'}}, 'test')
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with self.assertLogs('djradicale', 'WARNING'):
+                auth = Auth(configuration)
+            auth.login('user', 'password')
+            with self.assertNumQueries(1):
+                self.assertEqual(auth.login('user', 'password'), 'user')
@@ -0,0 +1,60 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from djradicale.models import DBChange, DBCollection, DBItem
+
+
+class IndexTestCase(TestCase):
+    """
+    Check the query plans of the queries run by the storage.
+    """
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # the tables are too small for the planner to prefer an index
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest('no plan checks for %s' % connection.vendor)
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn('USING', plan)
+            self.assertNotRegex(plan, r'\bSCAN %s\b' % queryset.model._meta.db_table)
+        else:
+            self.assertNotIn('Seq Scan', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_items(self):
+        self.assertUsesIndex(DBItem.objects.filter(collection_id=1))
+        self.assertUsesIndex(DBItem.objects.filter(collection_id=1, name='a.ics'))
+        self.assertUsesIndex(DBItem.objects.filter(collection_id=1, uid='a'))
+        self.assertUsesIndex(DBItem.objects.filter(
+            collection_id=1, start__lt=1, end__gt=0))
+
+    def test_collections(self):
+        self.assertUsesIndex(DBCollection.objects.filter(path='user/a.ics'))
+        self.assertUsesIndex(DBCollection.objects.filter(parent_path='user'))
+
+    def test_changes(self):
+        self.assertUsesIndex(DBChange.objects.filter(collection_id=1, id__gt=1))
+        self.assertUsesIndex(DBChange.objects.filter(
+            collection_id=1, timestamp__lt=timezone.now()))
@@ -0,0 +1,92 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from djradicale.item import Item, ParseCache
+
+
+VCARD = '''BEGIN:VCARD
+VERSION:3.0
+UID:{uid}
+FN:{uid}
+N:{uid};;;;
+END:VCARD
+'''
+
+
+class ParseCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_hit(self):
+        parse_cache = ParseCache(1024)
+        text = VCARD.format(uid='a')
+        vobject_item = parse_cache.get(('c', 'a.vcf', '"1"'), text)
+        self.assertEqual(vobject_item.fn.value, 'a')
+        self.assertIs(parse_cache.get(('c', 'a.vcf', '"1"'), text), vobject_item)
+        # a new etag is a new entry
+        self.assertIsNot(parse_cache.get(('c', 'a.vcf', '"2"'), text), vobject_item)
+
+    def test_size(self):
+        size = len(VCARD.format(uid='a'))
+        parse_cache = ParseCache(size * 2)
+        a = parse_cache.get(('c', 'a.vcf', '"1"'), VCARD.format(uid='a'))
+        b = parse_cache.get(('c', 'b.vcf', '"1"'), VCARD.format(uid='b'))
+        parse_cache.get(('c', 'a.vcf', '"1"'), VCARD.format(uid='a'))
+        parse_cache.get(('c', 'c.vcf', '"1"'), VCARD.format(uid='c'))
+        # "b" was the least recently used entry
+        self.assertIs(parse_cache.get(('c', 'a.vcf', '"1"'), 'invalid'), a)
+        self.assertIsNot(parse_cache.get(('c', 'b.vcf', '"1"'), VCARD.format(uid='b')), b)
+
+    def test_size_in_bytes(self):
+        text = VCARD.format(uid='\u00e9' * 100)
+        parse_cache = ParseCache(len(text) + 1)
+        parse_cache.get(('c', 'a.vcf', '"1"'), text)
+        # twice as many bytes as characters, too large to be kept
+        self.assertEqual(len(parse_cache._items), 0)
+
+    def test_shared(self):
+        text = VCARD.format(uid='a')
+        ParseCache(0, 'default').get(('c', 'a.vcf', '"1"'), text)
+        # parsed by another process
+        vobject_item = ParseCache(0, 'default').get(('c', 'a.vcf', '"1"'), 'invalid')
+        self.assertEqual(vobject_item.fn.value, 'a')
+
+    def test_item(self):
+        parse_cache = ParseCache(1024)
+        items = [
+            Item(collection_path='c', href='a.vcf', text=VCARD.format(uid='a'),
+                 etag='"1"', parse_cache=parse_cache)
+            for _ in range(2)
+        ]
+        self.assertEqual(items[0].uid, 'a')
+        self.assertIs(items[0].vobject_item, items[1].vobject_item)
+
+    def test_lazy_text(self):
+        parse_cache = ParseCache(1024)
+        parse_cache.get(('c', 'a.vcf', '"1"'), VCARD.format(uid='a'))
+        loaded = []
+
+        def text_loader():
+            loaded.append(True)
+            return VCARD.format(uid='a')
+
+        item = Item(collection_path='c', href='a.vcf', text_loader=text_loader,
+                    etag='"1"', parse_cache=parse_cache)
+        self.assertEqual(item.vobject_item.fn.value, 'a')
+        self.assertEqual(loaded, [])
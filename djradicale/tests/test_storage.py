@@ -0,0 +1,483 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+import xml.etree.ElementTree as ET
+
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from radicale import config
+from radicale.item import Item
+
+from djradicale.models import (
+    DBChange, DBCollection, DBItem, DBProperties, DBTimezone)
+from djradicale.storage import BULK_SIZE, Collection, Storage, request_scope
+
+
+VCARD = '''BEGIN:VCARD
+VERSION:3.0
+UID:{uid}
+FN:{fn}
+N:{fn};;;;
+END:VCARD
+'''
+
+VLIST = '''BEGIN:VLIST
+VERSION:1.0
+UID:{uid}
+FN:Friends
+CARD;EMAIL=john@example.com;FN=John Smith:john.vcf
+END:VLIST
+'''
+
+
+class StorageTestCase(TestCase):
+    ITEMS = 20
+
+    def setUp(self):
+        self.dbcollection = DBCollection.objects.create(
+            path='user/addressbook.vcf', parent_path='user')
+        DBProperties.objects.create(
+            path='user/addressbook.vcf', text='{"tag": "VADDRESSBOOK"}')
+        for i in range(self.ITEMS):
+            DBItem.objects.create(
+                collection=self.dbcollection, name='%d.vcf' % i,
+                text=VCARD.format(uid=i, fn='Contact %d' % i))
+        self.storage = Storage(config.load())
+
+    def test_get_all_queries(self):
+        collection = self.dbcollection.as_collection()
+        with self.assertNumQueries(1):
+            items = list(collection.get_all())
+        self.assertEqual(len(items), self.ITEMS)
+        self.assertTrue(all(i.collection is collection for i in items))
+
+    def test_discover_queries(self):
+        # collection with its properties, items of the collection
+        with self.assertNumQueries(2):
+            collection, *items = self.storage.discover(
+                '/user/addressbook.vcf/', depth='1')
+        self.assertEqual(len(items), self.ITEMS)
+        self.assertTrue(all(i.collection is collection for i in items))
+
+    def test_discover_defers_text(self):
+        DBItem.objects.update(etag='"etag"', vobject_name='VCARD')
+        collection, *items = self.storage.discover(
+            '/user/addressbook.vcf/', depth='1')
+        with self.assertNumQueries(0):
+            self.assertEqual({(i.etag, i.name) for i in items},
+                             {('"etag"', 'VCARD')})
+        with self.assertNumQueries(1):
+            self.assertIn('BEGIN:VCARD', items[0].serialize())
+        with self.assertNumQueries(0):
+            self.assertEqual(items[0].vobject_item.name, 'VCARD')
+
+    def test_vlist(self):
+        # SOGo lists of contacts
+        text = VLIST.format(uid='list')
+        collection, = self.storage.discover('/user/addressbook.vcf/')
+        collection.upload('list.vcf', Item(
+            collection_path=collection.path, text=text))
+        self.assertEqual(DBItem.objects.get(name='list.vcf').vobject_name, 'VLIST')
+        item, = self.storage.discover('/user/addressbook.vcf/list.vcf')
+        with self.assertNumQueries(0):
+            self.assertEqual(item.name, 'VLIST')
+        self.assertIn('BEGIN:VLIST', item.serialize())
+
+    def test_chunk_size(self):
+        configuration = config.load()
+        configuration.update({'storage': {'chunk_size': '7'}}, 'test')
+        storage = Storage(configuration)
+        collection = self.dbcollection.as_collection(storage)
+        self.assertEqual(collection.chunk_size, 7)
+        self.assertEqual(len(list(collection.get_all())), self.ITEMS)
+
+    def test_compress(self):
+        configuration = config.load()
+        configuration.update({'storage': {'compress': 'True'}}, 'test')
+        collection = self.dbcollection.as_collection(Storage(configuration))
+        item = Item(collection_path=collection.path,
+                    text=VCARD.format(uid='new', fn='New'))
+        collection.upload('new.vcf', item)
+        dbitem = DBItem.objects.get(name='new.vcf')
+        self.assertEqual(dbitem.text, '')
+        self.assertEqual(dbitem.get_text(), item.serialize())
+        uploaded, = collection.get_multi(['new.vcf'])
+        self.assertEqual(uploaded[1].serialize(), item.serialize())
+
+    def test_compress_command(self):
+        texts = dict(DBItem.objects.values_list('name', 'text'))
+        call_command('djradicale_compress', stdout=StringIO())
+        self.assertFalse(DBItem.objects.filter(data__isnull=True).exists())
+        _, *items = self.storage.discover('/user/addressbook.vcf/', depth='1')
+        self.assertEqual({i.href: i.serialize() for i in items}, texts)
+        call_command('djradicale_compress', '--decompress', stdout=StringIO())
+        self.assertEqual(dict(DBItem.objects.values_list('name', 'text')), texts)
+
+    def test_discover_meta(self):
+        collection, = self.storage.discover('/user/addressbook.vcf/')
+        with self.assertNumQueries(0):
+            self.assertEqual(collection.get_meta(), {'tag': 'VADDRESSBOOK'})
+            self.assertEqual(collection.tag, 'VADDRESSBOOK')
+        collection.set_meta({'tag': 'VADDRESSBOOK', 'D:displayname': 'Contacts'})
+        with self.assertNumQueries(0):
+            self.assertEqual(collection.get_meta('D:displayname'), 'Contacts')
+        self.assertEqual(
+            Collection('user/addressbook.vcf').get_meta('D:displayname'),
+            'Contacts')
+
+    def test_discover_children(self):
+        etag = self.dbcollection.as_collection().etag
+        DBCollection.objects.create(path='user', parent_path='')
+        for i in range(30):
+            path = 'user/calendar-%d.ics' % i
+            DBCollection.objects.create(path=path, parent_path='user', etag='"%d"' % i)
+            DBProperties.objects.create(
+                path=path, text='{"tag": "VCALENDAR", "D:displayname": "%d"}' % i)
+
+        with self.assertNumQueries(2):
+            home, *children = self.storage.discover('/user/', depth='1')
+            metadata = {(c.path, c.tag, c.get_meta('D:displayname'), c.etag)
+                        for c in children}
+        self.assertEqual(home.path, 'user')
+        self.assertEqual(len(metadata), 31)
+        self.assertIn(('user/calendar-7.ics', 'VCALENDAR', '7', '"7"'), metadata)
+        self.assertIn(('user/addressbook.vcf', 'VADDRESSBOOK', None, etag), metadata)
+
+    def test_acquire_lock(self):
+        savepoints = len(connection.savepoint_ids)
+        with self.storage.acquire_lock('r', 'user'):
+            self.assertEqual(len(connection.savepoint_ids), savepoints)
+            with CaptureQueriesContext(connection) as queries:
+                list(self.storage.discover('/user/addressbook.vcf/0.vcf'))
+            self.assertEqual(len(queries), 2)
+        with self.storage.acquire_lock('w', 'user'):
+            self.assertEqual(len(connection.savepoint_ids), savepoints + 1)
+            with CaptureQueriesContext(connection) as queries:
+                list(self.storage.discover('/user/addressbook.vcf/'))
+                list(self.storage.discover('/user/addressbook.vcf/0.vcf'))
+            # the parent collection of the item is locked first
+            self.assertEqual(len(queries), 4)
+            if connection.features.has_select_for_update:
+                self.assertIn('FOR UPDATE', queries[0]['sql'])
+                self.assertIn('FOR UPDATE', queries[2]['sql'])
+
+    def test_request_scope(self):
+        with request_scope() as memo:
+            collection, = self.storage.discover('/user/addressbook.vcf/')
+            with self.assertNumQueries(0):
+                self.assertEqual(list(self.storage.discover(
+                    '/user/addressbook.vcf/')), [collection])
+            self.assertEqual((memo.hits, memo.misses), (1, 1))
+            # depth 1 listings aren't kept
+            self.assertEqual(len(list(self.storage.discover(
+                '/user/addressbook.vcf/', depth='1'))), self.ITEMS + 1)
+            self.assertEqual((memo.hits, memo.misses), (1, 1))
+
+            self.assertEqual(list(self.storage.discover('/user/new.vcf')), [])
+            item = Item(collection_path=collection.path,
+                        text=VCARD.format(uid='new', fn='New'))
+            collection.upload('new.vcf', item)
+            new, = self.storage.discover('/user/addressbook.vcf/new.vcf')
+            self.assertEqual(new.href, 'new.vcf')
+            self.assertEqual((memo.hits, memo.misses), (1, 3))
+        self.assertEqual(len(list(self.storage.discover(
+            '/user/addressbook.vcf/'))), 1)
+
+    def test_meta_cache(self):
+        cache.clear()
+        configuration = config.load()
+        configuration.update({'storage': {'meta_cache_alias': 'default'}}, 'test')
+        # two processes sharing the cache
+        storage, other = Storage(configuration), Storage(configuration)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            etag = Collection('user/addressbook.vcf', storage=storage).etag
+        collection, = storage.discover('/user/addressbook.vcf/')
+        with self.assertNumQueries(0):
+            cached, = other.discover('/user/addressbook.vcf/')
+            self.assertEqual(cached.collection_id, self.dbcollection.pk)
+            self.assertEqual(cached.get_meta('tag'), 'VADDRESSBOOK')
+            self.assertEqual(cached.etag, etag)
+            self.assertEqual(Collection(
+                'user/addressbook.vcf', storage=other).get_meta('tag'),
+                'VADDRESSBOOK')
+
+        # replaced once the write is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            collection.set_meta({'tag': 'VADDRESSBOOK', 'D:displayname': 'A'})
+        cached, = other.discover('/user/addressbook.vcf/')
+        self.assertEqual(cached.get_meta('D:displayname'), 'A')
+        with self.captureOnCommitCallbacks(execute=True):
+            collection.upload('new.vcf', Item(
+                collection_path=collection.path,
+                text=VCARD.format(uid='new', fn='New')))
+        cached, = other.discover('/user/addressbook.vcf/')
+        self.assertEqual(cached.etag, collection.etag)
+        self.assertNotEqual(cached.etag, etag)
+
+        # nothing is stored for missing collections, e.g. item paths
+        self.assertEqual(list(other.discover('/user/new.vcf/')), [])
+        self.assertEqual(len(list(other.discover(
+            '/user/addressbook.vcf/new.vcf'))), 1)
+        for path in ('user/new.vcf', 'user/addressbook.vcf/new.vcf'):
+            self.assertIsNone(cache.get(other.meta_cache._key('version', path)))
+        with self.captureOnCommitCallbacks(execute=True):
+            storage.create_collection('/user/new.vcf/')
+        self.assertEqual(len(list(other.discover('/user/new.vcf/'))), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            collection.delete()
+        self.assertEqual(list(other.discover('/user/addressbook.vcf/')), [])
+
+        # the database is read directly under the write lock
+        with other.acquire_lock('w', 'user'):
+            with self.assertNumQueries(1):
+                self.assertEqual(len(list(other.discover('/user/new.vcf/'))), 1)
+
+    def test_as_items_queries(self):
+        with self.assertNumQueries(1):
+            items = list(DBItem.objects.all().as_items())
+        self.assertEqual(len(items), self.ITEMS)
+        self.assertEqual(len({id(i.collection) for i in items}), 1)
+
+    def test_get_multi(self):
+        collection = self.dbcollection.as_collection()
+        hrefs = ['%d.vcf' % i for i in range(BULK_SIZE + 5)] + ['1.vcf']
+        with self.assertNumQueries(2):
+            items = list(collection.get_multi(hrefs))
+        self.assertEqual([href for href, _ in items], hrefs[:-1])
+        self.assertEqual(
+            [href for href, item in items if item is not None],
+            ['%d.vcf' % i for i in range(self.ITEMS)])
+        self.assertTrue(all(item.href == href for href, item in items if item))
+
+        missing = Collection('user/missing.vcf')
+        self.assertEqual(list(missing.get_multi(['1.vcf'])), [('1.vcf', None)])
+
+    def test_stored_etag(self):
+        collection = Collection('user/addressbook.vcf')
+        item = next(iter(collection.get_all()))
+        etag = collection.upload(item.href, item).etag
+        self.assertEqual(DBItem.objects.get(name=item.href).etag, etag)
+
+        (href, item), = collection.get_multi([item.href])
+        # the etag is handed through instead of hashing the text
+        self.assertEqual(item._etag, etag)
+
+    def test_collection_etag(self):
+        collection = Collection('user/addressbook.vcf')
+        initial = collection.etag
+        # the initial ETag is the one computed by radicale
+        self.assertEqual(initial, super(Collection, collection).etag)
+        with self.assertNumQueries(0):
+            self.assertEqual(collection.etag, initial)
+        with self.assertNumQueries(1):
+            self.assertEqual(Collection('user/addressbook.vcf').etag, initial)
+
+        item = next(iter(collection.get_all()))
+        collection.upload(item.href, item)
+        uploaded = collection.etag
+        self.assertNotEqual(uploaded, initial)
+
+        collection.delete(item.href)
+        deleted = collection.etag
+        self.assertNotIn(deleted, (initial, uploaded))
+
+        collection.set_meta({'tag': 'VADDRESSBOOK', 'D:displayname': 'Contacts'})
+        self.assertNotIn(collection.etag, (initial, uploaded, deleted))
+
+    def test_sync(self):
+        collection = Collection('user/addressbook.vcf', storage=self.storage)
+        token, names = collection.sync()
+        self.assertEqual(len(list(names)), self.ITEMS)
+
+        first, second = list(collection.get_all())[:2]
+        collection.upload(first.href, first)
+        collection.delete(second.href)
+        new_token, names = collection.sync(token)
+        self.assertNotEqual(new_token, token)
+        self.assertEqual(sorted(names), sorted([first.href, second.href]))
+
+        self.assertEqual(list(collection.sync(new_token)[1]), [])
+        with self.assertRaises(ValueError):
+            collection.sync('http://example.com/sync/1')
+
+    def test_sync_expired(self):
+        collection = Collection('user/addressbook.vcf', storage=self.storage)
+        token, _ = collection.sync()
+        item = next(iter(collection.get_all()))
+        collection.upload(item.href, item)
+        DBChange.objects.expire(self.dbcollection.pk, timezone.now())
+        with self.assertRaises(ValueError):
+            collection.sync(token)
+        # a full sync hands out a valid token again
+        token, _ = collection.sync()
+        self.assertEqual(list(collection.sync(token)[1]), [])
+
+    def test_last_modified(self):
+        collection = Collection('user/addressbook.vcf')
+        self.assertIsNone(collection.last_modified)
+        item = next(iter(collection.get_all()))
+        collection.upload(item.href, item)
+        with self.assertNumQueries(1):
+            self.assertTrue(collection.last_modified)
+
+
+VEVENT = '''BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//djradicale//tests//EN
+BEGIN:VEVENT
+UID:{uid}
+DTSTAMP:20200101T000000Z
+DTSTART:{start}
+DTEND:{end}
+SUMMARY:{uid}
+END:VEVENT
+END:VCALENDAR
+'''
+
+VTIMEZONE = '''BEGIN:VTIMEZONE
+TZID:Europe/Moscow
+BEGIN:STANDARD
+DTSTART:20111030T030000
+TZOFFSETFROM:+0400
+TZOFFSETTO:+0300
+TZNAME:MSK
+END:STANDARD
+END:VTIMEZONE
+'''
+
+TIME_RANGE_FILTER = '''<C:filter xmlns:C="urn:ietf:params:xml:ns:caldav">
+<C:comp-filter name="VCALENDAR">
+<C:comp-filter name="VEVENT">
+<C:time-range start="{start}" end="{end}"/>
+</C:comp-filter>
+</C:comp-filter>
+</C:filter>
+'''
+
+
+class CalendarStorageTestCase(TestCase):
+    def setUp(self):
+        DBCollection.objects.create(path='user/calendar.ics', parent_path='user')
+        DBProperties.objects.create(path='user/calendar.ics', text='{"tag": "VCALENDAR"}')
+        self.collection = Collection('user/calendar.ics')
+
+    def upload(self, uid, start, end):
+        item = Item(collection_path='user/calendar.ics', text=VEVENT.format(
+            uid=uid, start=start, end=end))
+        item.prepare()
+        return self.collection.upload('%s.ics' % uid, item)
+
+    def get_filtered(self, start, end):
+        filters = [ET.fromstring(TIME_RANGE_FILTER.format(start=start, end=end))]
+        return sorted(i.href for i, _ in self.collection.get_filtered(filters))
+
+    def test_time_range(self):
+        for day in range(1, 29):
+            self.upload('event-%02d' % day,
+                        '202002%02dT100000Z' % day, '202002%02dT110000Z' % day)
+        self.upload('weekly', '20200101T100000Z', '20200101T110000Z')
+        DBItem.objects.filter(name='weekly.ics').update(text=VEVENT.format(
+            uid='weekly', start='20200101T100000Z', end='20200101T110000Z',
+        ).replace('SUMMARY', 'RRULE:FREQ=WEEKLY\nSUMMARY'), start=None, end=None,
+            component_name=None)
+
+        self.assertEqual(
+            self.get_filtered('20200203T000000Z', '20200205T000000Z'),
+            ['event-03.ics', 'event-04.ics', 'weekly.ics'])
+        self.assertEqual(
+            self.get_filtered('20200206T000000Z', '20200207T000000Z'),
+            ['event-06.ics', 'weekly.ics'])
+        self.assertEqual(
+            self.get_filtered('20191201T000000Z', '20191202T000000Z'), [])
+        self.assertEqual(
+            self.get_filtered('20210101T000000Z', '20210102T000000Z'),
+            ['weekly.ics'])
+
+    def test_stored_time_range(self):
+        self.upload('event', '20200201T100000Z', '20200201T110000Z')
+        dbitem = DBItem.objects.get(name='event.ics')
+        self.assertEqual(dbitem.component_name, 'VEVENT')
+        self.assertEqual((dbitem.start, dbitem.end), (1580551200, 1580554800))
+
+    def test_has_uid(self):
+        self.upload('event', '20200201T100000Z', '20200201T110000Z')
+        self.assertEqual(DBItem.objects.get(name='event.ics').uid, 'event')
+        with self.assertNumQueries(1):
+            self.assertTrue(self.collection.has_uid('event'))
+        self.assertFalse(self.collection.has_uid('event.ics'))
+        self.assertFalse(Collection('user/other.ics').has_uid('event'))
+
+    def test_deduplicate_timezones(self):
+        configuration = config.load()
+        configuration.update({'storage': {'deduplicate_timezones': 'True'}}, 'test')
+        storage = Storage(configuration)
+        collection, = storage.discover('/user/calendar.ics/')
+        texts = {}
+        for uid in ('a', 'b'):
+            text = VEVENT.format(
+                uid=uid, start='20200201T100000', end='20200201T110000',
+            ).replace('DTSTART:', 'DTSTART;TZID=Europe/Moscow:').replace(
+                'DTEND:', 'DTEND;TZID=Europe/Moscow:')
+            item = Item(collection_path=collection.path, text=text.replace(
+                'BEGIN:VEVENT', VTIMEZONE + 'BEGIN:VEVENT'))
+            texts[uid + '.ics'] = item.serialize()
+            collection.upload(uid + '.ics', item)
+
+        self.assertEqual(DBTimezone.objects.count(), 1)
+        for dbitem in DBItem.objects.all():
+            self.assertTrue(dbitem.vtimezones)
+            self.assertNotIn('BEGIN:VTIMEZONE', dbitem.text)
+        items = {i.href: i for i in collection.get_all()}
+        self.assertEqual({k: v.serialize() for k, v in items.items()}, texts)
+        self.assertEqual(items['a.ics'].time_range, (1580540400, 1580544000))
+
+        # client texts looking like stored ones are kept as they are
+        text = texts['a.ics'].replace(
+            'BEGIN:VEVENT', 'X-DJRADICALE-VTIMEZONE:%s\r\nBEGIN:VEVENT' % (
+                DBTimezone.objects.get().digest))
+        collection.upload('c.ics', Item(collection_path=collection.path, text=text))
+        self.assertEqual(DBItem.objects.get(name='c.ics').get_text(), text)
+
+    def test_create_collection(self):
+        self.upload('old', '20200201T100000Z', '20200201T110000Z')
+        token, _ = self.collection.sync()
+
+        items = []
+        for i in range(BULK_SIZE + 10):
+            item = Item(collection_path='user/calendar.ics', text=VEVENT.format(
+                uid='event-%d' % i, start='20200201T100000Z', end='20200201T110000Z'))
+            item.prepare()
+            items.append(item)
+        storage = Storage(config.load())
+        with CaptureQueriesContext(connection) as queries:
+            collection = storage.create_collection(
+                '/user/calendar.ics/', iter(items), {'tag': 'VCALENDAR'})
+        self.assertLess(len(queries), 40)
+
+        names = set(DBItem.objects.values_list('name', flat=True))
+        self.assertEqual(names, {'event-%d.ics' % i for i in range(BULK_SIZE + 10)})
+        self.assertEqual(collection.get_meta(), {'tag': 'VCALENDAR'})
+        self.assertEqual(DBItem.objects.get(name='event-0.ics').start, 1580551200)
+        _, changed = collection.sync(token)
+        self.assertEqual(set(changed), names | {'old.ics'})
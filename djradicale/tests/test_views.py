@@ -0,0 +1,126 @@
+# Copyright (C) 2022 Kyoken, kyoken@kyoken.ninja
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+import copy
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import BadRequest
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase,
+    TransactionTestCase, override_settings)
+
+from djradicale.models import DBCollection, DBItem, DBProperties
+from djradicale.views import AsyncDjRadicaleView, DjRadicaleView, get_application
+
+from . import DAVClient
+
+
+class ApplicationTestCase(SimpleTestCase):
+    def test_application_is_shared(self):
+        self.assertIs(get_application(), get_application())
+
+    def test_application_is_rebuilt_on_config_change(self):
+        application = get_application()
+        config = copy.deepcopy(settings.DJRADICALE_CONFIG)
+        config['auth']['realm'] = 'Other realm'
+        with override_settings(DJRADICALE_CONFIG=config):
+            other = get_application()
+            self.assertIsNot(other, application)
+            self.assertEqual(other.configuration.get('auth', 'realm'), 'Other realm')
+            self.assertIs(get_application(), other)
+        self.assertIsNot(get_application(), other)
+
+
+class ViewTestCase(TestCase):
+    VCARD = '''BEGIN:VCARD
+VERSION:3.0
+UID:test.vcf
+FN:John Smith
+N:Smith;John;;;
+END:VCARD
+'''
+
+    def setUp(self):
+        User.objects.create_user(username='user', password='password')
+        DBCollection.objects.create(path='user/addressbook.vcf', parent_path='user')
+        DBProperties.objects.create(path='user/addressbook.vcf', text='{"tag": "VADDRESSBOOK"}')
+        self.client = DAVClient()
+        self.client.http_auth('user', 'password')
+        self.client.put('/radicale/user/addressbook.vcf/test.vcf', data=self.VCARD)
+
+    def test_vlist(self):
+        text = self.VCARD.replace('VCARD', 'VLIST').replace('test.vcf', 'list.vcf')
+        self.client.put('/radicale/user/addressbook.vcf/list.vcf', data=text)
+        response = self.client.get('/radicale/user/addressbook.vcf/list.vcf')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/x-vlist'))
+        self.assertIn(b'BEGIN:VLIST', response.content)
+
+    def test_body_read_before(self):
+        # e.g. by a middleware, the WSGI input is exhausted then
+        request = RequestFactory().put(
+            '/radicale/user/addressbook.vcf/other.vcf',
+            data=self.VCARD.replace('test.vcf', 'other.vcf'),
+            content_type='text/vcard',
+            HTTP_AUTHORIZATION=self.client.http_authorization)
+        self.assertIn(b'BEGIN:VCARD', request.body)
+        response = DjRadicaleView.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('FN:John Smith', DBItem.objects.get(name='other.vcf').get_text())
+
+    def test_body_partially_read(self):
+        request = RequestFactory().put(
+            '/radicale/user/addressbook.vcf/other.vcf',
+            data=self.VCARD.replace('test.vcf', 'other.vcf'),
+            content_type='text/vcard',
+            HTTP_AUTHORIZATION=self.client.http_authorization)
+        request.read(10)
+        with self.assertRaises(BadRequest):
+            DjRadicaleView.as_view()(request)
+        self.assertFalse(DBItem.objects.filter(name='other.vcf').exists())
+
+
+class AsyncViewTestCase(TransactionTestCase):
+    # radicale runs in other threads, with their own database connections
+    VCARD = ViewTestCase.VCARD
+
+    def setUp(self):
+        User.objects.create_user(username='user', password='password')
+        DBCollection.objects.create(path='user/addressbook.vcf', parent_path='user')
+        DBProperties.objects.create(path='user/addressbook.vcf', text='{"tag": "VADDRESSBOOK"}')
+        self.client = DAVClient()
+        self.client.http_auth('user', 'password')
+
+    async def request(self, method, **kwargs):
+        request = AsyncRequestFactory().generic(
+            method, '/radicale/user/addressbook.vcf/test.vcf',
+            headers={'Authorization': self.client.http_authorization}, **kwargs)
+        return await AsyncDjRadicaleView.as_view()(request)
+
+    async def test_put_get(self):
+        response = await self.request(
+            'PUT', data=self.VCARD, content_type='text/vcard')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await DBItem.objects.filter(name='test.vcf').aexists())
+
+        response = await self.request('GET')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'FN:John Smith', response.content)
+
+    async def test_method_not_allowed(self):
+        response = await self.request('TRACE')
+        self.assertEqual(response.status_code, 405)
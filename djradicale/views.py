@@ -17,17 +17,31 @@
 import base64
 import copy
 import logging
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.core.exceptions import BadRequest
+from django.db import close_old_connections
+from django.http import HttpResponse, RawPostDataException
 from django.urls import reverse
 from django.utils.decorators import method_decorator
+from django.utils.functional import classproperty
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import RedirectView, View
 
 from radicale import Application, config, log
 
+from .storage import request_scope
+
+logger = logging.getLogger('djradicale')
+
 
 class ApplicationResponse(HttpResponse):
     def start_response(self, status, headers):
@@ -36,7 +50,74 @@ class ApplicationResponse(HttpResponse):
             self[k] = v
 
 
-class DjRadicaleView(Application, View):
+_application = None
+_application_lock = threading.Lock()
+
+
+def get_application():
+    """
+    Return the process-wide Radicale application.
+
+    The application (with its auth, rights and storage plugins) is built
+    lazily on first use and rebuilt only when ``DJRADICALE_CONFIG`` changes.
+    """
+    global _application
+    cached = _application
+    if cached is not None and cached[0] == settings.DJRADICALE_CONFIG:
+        return cached[1]
+    with _application_lock:
+        if _application is None or _application[0] != settings.DJRADICALE_CONFIG:
+            _application = (
+                copy.deepcopy(settings.DJRADICALE_CONFIG),
+                Application(config.load()))
+        return _application[1]
+
+
+def get_input(request):
+    """
+    Return the body of ``request`` as a file-like object for Radicale.
+
+    The body is read from django's stream, limited to the content length:
+    the raw input under WSGI, a file spooled to disk beyond
+    ``FILE_UPLOAD_MAX_MEMORY_SIZE`` under ASGI. Bodies already loaded by
+    ``request.body`` (e.g. in a middleware) are read from memory.
+
+    Raises ``BadRequest`` if the stream was partially consumed already.
+    """
+    # request.body would load unread bodies into memory, subject to
+    # DATA_UPLOAD_MAX_MEMORY_SIZE, django has no public way to tell first
+    if not request._read_started:
+        return request
+    try:
+        return BytesIO(request.body)
+    except RawPostDataException:
+        logger.error('Body of %s %s was partially read',
+                     request.method, request.path)
+        raise BadRequest('The request body was partially read')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the thread pool running Radicale for ``AsyncDjRadicaleView``.
+
+    Its size is the ``max_connections`` option of the ``server`` section.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_connections = get_application().configuration.get(
+                'server', 'max_connections')
+            _executor = ThreadPoolExecutor(
+                max_workers=max_connections or None,
+                thread_name_prefix='djradicale')
+        return _executor
+
+
+class DjRadicaleView(View):
     http_method_names = [
         'delete',
         'get',
@@ -51,28 +132,64 @@ class DjRadicaleView(Application, View):
         'report',
     ]
 
-    def __init__(self, **kwargs):
-        configuration = config.load()
-        Application.__init__(self, configuration)
-        View.__init__(self, **kwargs)
+    def get_environ(self, request):
+        environ = request.META.copy()
+        path = environ['PATH_INFO']
+        if path.startswith(settings.DJRADICALE_PREFIX):
+            # cut known prefix from path (PATH_INFO) and
+            # move it into the base prefix (HTTP_X_SCRIPT_NAME)
+            environ['PATH_INFO'] = path[len(settings.DJRADICALE_PREFIX):]
+            environ['HTTP_X_SCRIPT_NAME'] = settings.DJRADICALE_PREFIX.rstrip('/')
+        environ['wsgi.input'] = get_input(request)
+        # missing for ASGI requests
+        environ.setdefault('wsgi.errors', sys.stderr)
+        return environ
+
+    def get_response(self, environ):
+        # radicale builds its answers completely before returning them,
+        # streaming them wouldn't save time or memory
+        response = ApplicationResponse()
+        with request_scope():
+            answer = get_application()(environ, response.start_response)
+        for i in answer:
+            response.write(i)
+        return response
 
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
         if not request.method.lower() in self.http_method_names:
             return self.http_method_not_allowed(request, *args, **kwargs)
-        response = ApplicationResponse()
+        return self.get_response(self.get_environ(request))
 
-        path = request.META['PATH_INFO']
-        if path.startswith(settings.DJRADICALE_PREFIX):
-            # cut known prefix from path (PATH_INFO) and
-            # move it into the base prefix (HTTP_X_SCRIPT_NAME)
-            request.META['PATH_INFO'] = path[len(settings.DJRADICALE_PREFIX):]
-            request.META['HTTP_X_SCRIPT_NAME'] = settings.DJRADICALE_PREFIX.rstrip('/')
 
-        answer = self(request.META, response.start_response)
-        for i in answer:
-            response.write(i)
-        return response
+class AsyncDjRadicaleView(DjRadicaleView):
+    """
+    ``DjRadicaleView`` for ASGI servers.
+
+    Radicale runs in the bounded pool of ``get_executor()`` instead of
+    django's single thread for synchronous code, the event loop only waits
+    for it.
+    """
+
+    @classproperty
+    def view_is_async(cls):
+        return True
+
+    def get_response_in_thread(self, environ):
+        close_old_connections()
+        try:
+            return self.get_response(environ)
+        finally:
+            close_old_connections()
+
+    @method_decorator(csrf_exempt)
+    async def dispatch(self, request, *args, **kwargs):
+        if not request.method.lower() in self.http_method_names:
+            return await self.http_method_not_allowed(request, *args, **kwargs)
+        get_response = sync_to_async(
+            self.get_response_in_thread, thread_sensitive=False,
+            executor=get_executor())
+        return await get_response(self.get_environ(request))
 
 
 class WellKnownView(RedirectView):
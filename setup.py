@@ -24,6 +24,8 @@ data = {
     'url': 'https://github.com/kyokenn/djradicale',
     'packages': [
         'djradicale',
+        'djradicale.management',
+        'djradicale.management.commands',
         'djradicale.migrations',
         'djradicale.tests',
     ],